@@ -13,6 +13,7 @@ import traceback
 from asyncio import (
     ALL_COMPLETED,
     CancelledError,
+    Event,
     Queue,
     Task,
     TimeoutError,
@@ -64,13 +65,101 @@ parser.add_argument(
     type=str,
     required=False,
 )
+parser.add_argument(
+    "--parallel",
+    default=1,
+    help="Number of jobs to run at once (also sets llamafile's parallel slots)",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    "--backends",
+    default=1,
+    help="Number of llamafile servers to run side by side on consecutive ports, jobs go to the least loaded one",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    "--candidates",
+    default=1,
+    help="Story and name candidates generated at once per job, the first valid one wins (also multiplies llamafile's parallel slots)",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    "--connect-timeout",
+    default=5.0,
+    help="Seconds to wait for a connection to llamafile",
+    type=float,
+    required=False,
+)
+parser.add_argument(
+    "--read-timeout",
+    default=300.0,
+    help="Seconds to wait for llamafile to answer a request",
+    type=float,
+    required=False,
+)
+parser.add_argument(
+    "--lore-cache",
+    default=10000,
+    help="Maximum number of generated art descriptions kept on disk, 0 disables",
+    type=int,
+    required=False,
+)
+parser.add_argument(
+    "--story-length",
+    choices=["MODEL", "TABLE"],
+    default="MODEL",
+    help="Ask the model how long a story should be (once per kind of item), or use a fixed table by quality",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    "--pipeline",
+    choices=["MULTI", "SINGLE"],
+    default="MULTI",
+    help="Generate story and name in separate validated calls, or together in one structured call that falls back to MULTI",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    "--validation",
+    choices=["LOCAL", "FALLBACK", "LLM"],
+    default="FALLBACK",
+    help="Check stories for being cut off by finish reason and punctuation, ask the model only when that is inconclusive, or always ask the model",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    "--warmup",
+    default="ENGLISH",
+    help="Comma separated languages whose story prompts are cached in llamafile before taking jobs, NONE to skip (ignored with one slot per llamafile)",
+    type=str,
+    required=False,
+)
+parser.add_argument(
+    "--slot-cache",
+    choices=["ON", "OFF"],
+    default="ON",
+    help="Save llamafile's KV cache of the story prompts once warmed up and restore it on startup or when a llamafile restarts (needs a llamafile with --slot-save-path)",
+    type=str,
+    required=False,
+)
 args = parser.parse_args()
+if args.parallel < 1:
+    parser.error("--parallel must be at least 1")
+if args.backends < 1:
+    parser.error("--backends must be at least 1")
+if args.candidates < 1:
+    parser.error("--candidates must be at least 1")
 logger.setLevel(args.loglevel)
 
 # import health
-from . import client, server
+from . import client, metrics, server
+from .health import llamafile_launches, llamafile_listening
 # generated by protoc
-from .job.job_pb2 import JobRequest, JobResponse
+from .job.job_pb2 import JobRequest, JobResponse, SupportedLanguage
 
 MAX_INTERVAL = 30
 RETRY_HISTORY = 3
@@ -132,31 +221,78 @@ LLAMAFILE_TEMPLATE: str | None = LLAMAFILE_TEMPLATES.get(
     str("medium" if LLAMAFILE_SIZE == "small" else LLAMAFILE_SIZE),
     None,  # specify medium because using smaller medium for small
 )
-LLAMAFILE_PARAMS_LIST: list[str] = (
-    [
-        "--host",
-        "127.0.0.1",
-        "--port",
-        "50052",
-        "-ngl",
-        "9999",
-        "--server",
-        "--nobrowser",
-    ]
-    + (["--chat-template", LLAMAFILE_TEMPLATE] if LLAMAFILE_TEMPLATE else [])
-    + [
-        "-c",
-        "4096",
-        "-cb",
-        "-m",
-        str(LLAMAFILE_MODEL),
-    ]
-)
-logger.debug(f"Executing with params: {' '.join(LLAMAFILE_PARAMS_LIST)}")
+LLAMAFILE_PARALLEL: int = args.parallel
+SPECULATIVE_CANDIDATES: int = args.candidates
+# every worker may have all of its candidates generating at once
+LLAMAFILE_SLOTS: int = LLAMAFILE_PARALLEL * SPECULATIVE_CANDIDATES
+LLAMAFILE_BACKENDS: int = args.backends
+LLAMAFILE_PORTS: list[int] = [50052 + backend for backend in range(LLAMAFILE_BACKENDS)]
+# the slots are shared out between the backends, rounding up
+LLAMAFILE_BACKEND_SLOTS: int = -(-LLAMAFILE_SLOTS // LLAMAFILE_BACKENDS)
+LLAMAFILE_CONNECT_TIMEOUT: float = args.connect_timeout
+LLAMAFILE_READ_TIMEOUT: float = args.read_timeout
+LLAMAFILE_CTX_PER_SLOT: int = 4096  # llama.cpp splits -c evenly across -np slots
+LLAMAFILE_LISTENING: bytes = b"server listening"  # printed once it takes requests
+
+
+def llamafile_params(port: int) -> list[str]:
+    return (
+        [
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "-ngl",
+            "9999",
+            "--server",
+            "--nobrowser",
+        ]
+        + (["--chat-template", LLAMAFILE_TEMPLATE] if LLAMAFILE_TEMPLATE else [])
+        + [
+            "-c",
+            str(LLAMAFILE_CTX_PER_SLOT * LLAMAFILE_BACKEND_SLOTS),
+            "-np",
+            str(LLAMAFILE_BACKEND_SLOTS),
+            "-cb",
+            "-m",
+            str(LLAMAFILE_MODEL),
+        ]
+        + (["--slot-save-path", str(SLOT_CACHE_PATH)] if SLOT_CACHE_ENABLED else [])
+        # side by side servers would otherwise each start a thread per core
+        + (
+            ["-t", str(max(1, (os.cpu_count() or 1) // LLAMAFILE_BACKENDS))]
+            if LLAMAFILE_BACKENDS > 1
+            else []
+        )
+    )
 
 
-async def run_llama_forever():
+LORE_CACHE_PATH: pathlib.Path = pathlib.Path(os.getcwd()) / "lore_cache.sqlite3"
+LORE_CACHE_SIZE: int = max(args.lore_cache, 0)
+SLOT_CACHE_PATH: pathlib.Path = pathlib.Path(os.getcwd()) / "slot_cache"
+SLOT_CACHE_ENABLED: bool = args.slot_cache == "ON"
+STORY_LENGTH_MODE: str = args.story_length.lower()
+PIPELINE_MODE: str = args.pipeline.lower()
+VALIDATION_MODE: str = args.validation.lower()
+WARMUP_LANGUAGES: list[str] = [
+    language.strip().upper()
+    for language in args.warmup.split(",")
+    if language.strip() and language.strip().upper() != "NONE"
+]
+for language in WARMUP_LANGUAGES:
+    if language not in SupportedLanguage.keys():
+        parser.error(f"--warmup: unknown language {language}")
+if LLAMAFILE_BACKEND_SLOTS == 1:
+    # a job's length prompt takes the only slot before its story prompt runs
+    WARMUP_LANGUAGES = []
+
+
+async def run_llama_forever(port: int = LLAMAFILE_PORTS[0]):
     """Capture output (stdout and stderr) while running external command."""
+    params: list[str] = llamafile_params(port)
+    if SLOT_CACHE_ENABLED:
+        SLOT_CACHE_PATH.mkdir(exist_ok=True)
+    logger.debug(f"Executing with params: {' '.join(params)}")
     stderr_filepath = pathlib.Path("llama_stderr.log")
     if stderr_filepath.exists():
         stderr_filepath.unlink()
@@ -167,7 +303,7 @@ async def run_llama_forever():
     if os_name == "Windows":
         proc = await create_subprocess_exec(
             LLAMAFILE_PATH,
-            *LLAMAFILE_PARAMS_LIST,
+            *params,
             stdout=PIPE,
             stderr=DEVNULL,
         )
@@ -175,11 +311,15 @@ async def run_llama_forever():
         proc = await create_subprocess_exec(
             "sh",
             LLAMAFILE_PATH.as_posix(),
-            *LLAMAFILE_PARAMS_LIST,
+            *params,
             stdout=PIPE,
             stderr=DEVNULL,
         )
     sleep_for: float = 0.5
+    listening: Event = llamafile_listening[port]
+    listening.clear()
+    llamafile_launches[port] += 1
+    tail: bytes = b""
 
     try:
         while True:
@@ -193,7 +333,12 @@ async def run_llama_forever():
             except TimeoutError:
                 await sleep(sleep_for)
             else:
-                logger.debug(f"[AI Server] {out.decode().strip()}")
+                logger.debug(f"[AI Server {port}] {out.decode().strip()}")
+                # the line may be split across two reads
+                if not listening.is_set() and LLAMAFILE_LISTENING in (tail + out):
+                    logger.info(f"llamafile on port {port} is listening")
+                    listening.set()
+                tail = out[-len(LLAMAFILE_LISTENING) :]
             # try:
             #     err = await asyncio.wait_for(proc.stderr.read(2048), 0.1)
             # except asyncio.TimeoutError:
@@ -207,7 +352,7 @@ async def run_llama_forever():
         await proc.communicate()
         # stderr_file.flush()
         # stderr_file.close()
-        # logger.debug(f'{LLAMAFILE_PATH} {" ".join(LLAMAFILE_PARAMS_LIST)} exited with {proc.returncode}')
+        # logger.debug(f'{LLAMAFILE_PATH} {" ".join(params)} exited with {proc.returncode}')
 
 
 def supervise(
@@ -271,14 +416,25 @@ def raise_graceful_exit(*args):
     raise GracefulExit()
 
 
+# needs the settings above, like the client does
+from .cache import LoreCache
+
+
 async def main_async(
     iq: Queue[tuple[int, JobRequest]],
-    oq: Queue[tuple[int, JobResponse]],
+    registry: server.JobRegistry,
+    lore_cache: LoreCache | None,
 ):
     tasks: list[Task[Any]] = [
-        supervise(run_llama_forever),
-        supervise(partial(server.run, iq, oq)),
-        supervise(partial(client.run, iq, oq)),
+        *(
+            supervise(
+                partial(run_llama_forever, port), name=f"run_llama_forever_{port}"
+            )
+            for port in LLAMAFILE_PORTS
+        ),
+        supervise(partial(server.run, iq, registry, lore_cache)),
+        supervise(partial(client.run, iq, registry, lore_cache)),
+        supervise(metrics.run),
     ]
     await wait(
         tasks,
@@ -291,14 +447,18 @@ async def main_async(
 
 def main():
     iq: Queue[tuple[int, JobRequest]] = Queue()
-    oq: Queue[tuple[int, JobResponse]] = Queue()
+    registry: server.JobRegistry = server.JobRegistry()
+    # one cache the server reads hits from and the client fills
+    lore_cache: LoreCache | None = (
+        LoreCache(LORE_CACHE_PATH, LORE_CACHE_SIZE) if LORE_CACHE_SIZE > 0 else None
+    )
 
     loop = get_event_loop()
     signal.signal(signal.SIGINT, raise_graceful_exit)
     signal.signal(signal.SIGTERM, raise_graceful_exit)
 
     try:
-        tasks = ensure_future(main_async(iq, oq), loop=loop)
+        tasks = ensure_future(main_async(iq, registry, lore_cache), loop=loop)
         loop.run_until_complete(tasks)
     except GracefulExit as e:
         logger.info("Got signal: SIGINT, shutting down.")
@@ -309,3 +469,5 @@ def main():
             t.cancel()
         loop.run_until_complete(gather(*tasks, return_exceptions=True))
         loop.close()
+        if lore_cache is not None:
+            lore_cache.close()
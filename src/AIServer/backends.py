@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+from urllib.parse import urljoin
+
+import httpx
+from openai_python_client import Client
+
+from . import metrics
+from .__init__ import (
+    LLAMAFILE_CONNECT_TIMEOUT,
+    LLAMAFILE_READ_TIMEOUT,
+    LLAMAFILE_SLOTS,
+)
+from .health import AIHealth, llamafile_launches
+from .retry import BackendUnavailable, CircuitBreaker
+from .slots import SlotScheduler
+
+# weight of the newest call in a backend's running latency average
+LATENCY_SMOOTHING = 0.2
+# token counts remembered, templates and descriptions recur across jobs
+TOKENIZE_CACHE_SIZE = 1024
+# a slot file is a few hundred MB at most, a backend taking longer is stuck
+SLOT_ACTION_TIMEOUT = 30.0
+
+
+class Backend:
+    """One llamafile server with its own connection pool, slots and breaker."""
+
+    def __init__(self, host: str, port: int, slots: int):
+        self.name: str = f"{host}:{port}"
+        self.port: int = port
+        self.url: str = f"http://{host}:{port}/v1"
+        self.ai_health = AIHealth.UNKNOWN
+        # One keep-alive pool for the client's lifetime. Room for every slot
+        # of every backend plus a health check, as the others may be down
+        self.client: Client = Client(
+            self.url,
+            verify_ssl=False,
+            timeout=httpx.Timeout(
+                LLAMAFILE_READ_TIMEOUT, connect=LLAMAFILE_CONNECT_TIMEOUT
+            ),
+            httpx_args={
+                "limits": httpx.Limits(
+                    max_connections=LLAMAFILE_SLOTS + 1,
+                    max_keepalive_connections=LLAMAFILE_SLOTS + 1,
+                )
+            },
+        )
+        self.slots: SlotScheduler = SlotScheduler(slots)
+        self.breaker: CircuitBreaker = CircuitBreaker(self.name)
+        self.in_flight: int = 0
+        self.latency: float | None = None
+        # the llamafile start its slots are known for
+        self.launch: int = llamafile_launches[port]
+
+    def load(self, typical: float) -> float:
+        # expected wait if it took one more call now; a backend that hasn't
+        # answered yet is assumed as fast as the best one so it gets tried
+        latency: float = typical if self.latency is None else self.latency
+        return (self.in_flight + 1) * latency
+
+    def record_latency(self, seconds: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    async def tokenize(self, text: str) -> int:
+        # how many tokens the loaded model's tokenizer makes of the text
+        r = await self.client.get_async_httpx_client().post(
+            url=urljoin(self.url, "/tokenize"), json={"content": text}, timeout=5
+        )
+        r.raise_for_status()
+        return len(r.json()["tokens"])
+
+    async def slot_action(self, slot: int, action: str, filename: str) -> dict:
+        # save or restore a slot's KV cache to a file in --slot-save-path
+        r = await self.client.get_async_httpx_client().post(
+            url=urljoin(self.url, f"/slots/{slot}"),
+            params={"action": action},
+            json={"filename": filename},
+            timeout=SLOT_ACTION_TIMEOUT,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    async def close(self) -> None:
+        await self.client.get_async_httpx_client().aclose()
+        self.slots.report(self.name)
+
+
+class BackendPool:
+    """Routes each call to the least loaded healthy llamafile."""
+
+    def __init__(self, host: str, ports: list[int], slots: int):
+        self.backends: list[Backend] = [Backend(host, port, slots) for port in ports]
+        self.token_counts: OrderedDict[str, int] = OrderedDict()
+
+    def healthy(self) -> bool:
+        return any(backend.ai_health == AIHealth.HEALTHY for backend in self.backends)
+
+    def pick(self, avoid: Backend | None = None) -> Backend:
+        usable: list[Backend] = [
+            backend for backend in self.backends if backend.breaker.allows()
+        ]
+        if not usable:
+            metrics.incr("circuit_rejected")
+            raise BackendUnavailable("every llamafile is failing, not sending requests")
+        # a retry goes elsewhere if there is anywhere else to go
+        usable = [backend for backend in usable if backend is not avoid] or usable
+        # a backend whose health check is stale may still answer, but only
+        # try it once nothing known to be healthy is left
+        healthy: list[Backend] = [
+            backend for backend in usable if backend.ai_health == AIHealth.HEALTHY
+        ]
+        candidates: list[Backend] = healthy or usable
+        typical: float = min(
+            (b.latency for b in candidates if b.latency is not None), default=1.0
+        )
+        return min(candidates, key=lambda backend: backend.load(typical))
+
+    async def tokenize(self, text: str) -> int:
+        # every backend loads the same model, so any of them can count
+        tokens: int | None = self.token_counts.get(text)
+        if tokens is not None:
+            self.token_counts.move_to_end(text)
+            metrics.incr("tokenize_cache_hits")
+            return tokens
+        tokens = await self.pick().tokenize(text)
+        metrics.incr("tokenize_calls")
+        self.token_counts[text] = tokens
+        if len(self.token_counts) > TOKENIZE_CACHE_SIZE:
+            self.token_counts.popitem(last=False)
+        return tokens
+
+    @contextmanager
+    def use(self, backend: Backend) -> Iterator[Backend]:
+        backend.in_flight += 1
+        try:
+            yield backend
+        finally:
+            backend.in_flight -= 1
+
+    async def close(self) -> None:
+        for backend in self.backends:
+            await backend.close()
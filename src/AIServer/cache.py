@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import pathlib
+import sqlite3
+import time
+import xml.etree.ElementTree as ET
+
+import httpx
+
+from . import metrics
+from .__init__ import LLAMAFILE_MODEL, LLAMAFILE_TEMPLATE, logger
+from .backends import Backend
+from .job.job_pb2 import JobRequest, SupportedLanguage
+from .slots import PromptPrefix, prompt_head
+from .templates import trans_manager
+
+# Parts of an art xml_def that feed the prompts; everything else (position,
+# health, ticks, ...) changes over a save without changing the lore
+ART_FINGERPRINT_FIELDS: tuple[str, ...] = ("def", "stuff", "quality")
+# slots whose KV cache is worth keeping across restarts, the long story heads
+SLOT_CACHE_TEMPLATES: tuple[str, ...] = (
+    "story_mini_t",
+    "story_small_t",
+    "story_medium_t",
+)
+
+
+def art_fingerprint(
+    hash_code: int,
+    xml_def: str,
+    title: str,
+    description: str,
+    language: str,
+    model: str,
+) -> str:
+    try:
+        xml_def_et = ET.fromstring(xml_def)
+        fields = {name: xml_def_et.findtext(name) for name in ART_FINGERPRINT_FIELDS}
+    except ET.ParseError:
+        fields = {"xml_def": xml_def}
+    fingerprint = json.dumps(
+        [hash_code, fields, title, description, language, model],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def model_fingerprint() -> str:
+    # hashing gigabytes of weights on every start is too slow, a replaced
+    # model file has another size or modification time
+    try:
+        stat = LLAMAFILE_MODEL.stat()
+        identity = [LLAMAFILE_MODEL.name, stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        identity = [LLAMAFILE_MODEL.name]
+    return hashlib.sha256(json.dumps(identity).encode("utf-8")).hexdigest()
+
+
+def prompt_fingerprint(prefix: PromptPrefix) -> str:
+    # what the slot holds: the chat template's header and the prompt head
+    template_key, language = prefix
+    templates = trans_manager.get_templates(SupportedLanguage.Value(language))
+    fingerprint = json.dumps(
+        [LLAMAFILE_TEMPLATE, prompt_head(templates[template_key])],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+class LoreCache:
+    """Generated titles and stories on disk, evicting least recently used."""
+
+    def __init__(self, path: pathlib.Path, max_entries: int):
+        self.path: pathlib.Path = path
+        self.max_entries: int = max_entries
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+        # lookups happen on the event loop, keep commits cheap
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS lore ("
+            " key TEXT PRIMARY KEY,"
+            " title TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS lore_lru ON lore (last_used)")
+        # the limit may have shrunk since the last run
+        self.evict()
+        self.db.commit()
+        logger.debug(f"Lore cache at {path} holds {len(self)} entries")
+
+    @staticmethod
+    def key(art_job: JobRequest.ArtDescriptionJob, language: SupportedLanguage) -> str:
+        return art_fingerprint(
+            art_job.hash_code,
+            art_job.xml_def,
+            art_job.title,
+            art_job.description,
+            SupportedLanguage.Name(language),
+            LLAMAFILE_MODEL.name,
+        )
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM lore").fetchone()[0]
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        row = self.db.execute(
+            "SELECT title, description FROM lore WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            metrics.incr("lore_cache_misses")
+            return None
+        self.db.execute(
+            "UPDATE lore SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+        self.db.commit()
+        metrics.incr("lore_cache_hits")
+        return row[0], row[1]
+
+    def put(self, key: str, title: str, description: str) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO lore (key, title, description, last_used)"
+            " VALUES (?, ?, ?, ?)",
+            (key, title, description, time.time()),
+        )
+        self.evict()
+        self.db.commit()
+
+    def evict(self) -> None:
+        evicted = self.db.execute(
+            "DELETE FROM lore WHERE key IN ("
+            " SELECT key FROM lore ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount
+        if evicted > 0:
+            metrics.incr("lore_cache_evictions", evicted)
+
+    def close(self) -> None:
+        self.db.close()
+
+
+class SlotCache:
+    """llamafile slot KV caches for the story prompts, kept across restarts.
+
+    llamafile writes and reads the files itself in --slot-save-path. The
+    manifest beside them records the model and prompt head each file was
+    saved from, so a replaced model or changed translation is never
+    restored and its file is removed instead."""
+
+    def __init__(self, path: pathlib.Path):
+        self.path: pathlib.Path = path
+        self.manifest_path: pathlib.Path = path / "slots.json"
+        self.model: str = model_fingerprint()
+
+    def read_manifest(self) -> dict[str, dict[str, str | float]]:
+        try:
+            return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest: dict[str, dict[str, str | float]]) -> None:
+        self.path.mkdir(exist_ok=True)
+        self.manifest_path.write_text(
+            json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8"
+        )
+
+    def current(self, filename: str, entry: dict[str, str | float]) -> bool:
+        # saved from this model and prompt head, and still on disk
+        try:
+            prefix: PromptPrefix = (str(entry["template"]), str(entry["language"]))
+            return (
+                entry["model"] == self.model
+                and entry["prompt"] == prompt_fingerprint(prefix)
+                and (self.path / filename).is_file()
+            )
+        except (KeyError, ValueError):
+            return False
+
+    async def save(self, backends: list[Backend]) -> None:
+        manifest = self.read_manifest()
+        saved: set[PromptPrefix] = set()
+        for backend in backends:
+            for slot, prefix in enumerate(backend.slots.prefixes):
+                if prefix is None or prefix in saved:
+                    continue
+                if (
+                    prefix[0] not in SLOT_CACHE_TEMPLATES
+                    or backend.slots.in_flight[slot]
+                ):
+                    continue
+                filename = f"{prefix[0]}-{prefix[1]}.bin"
+                # restored from it, or saved from another backend last run
+                if filename in manifest and self.current(filename, manifest[filename]):
+                    continue
+                try:
+                    result = await backend.slot_action(slot, "save", filename)
+                except httpx.HTTPError as e:
+                    logger.warning(
+                        f"Could not save slot {slot} of {backend.name}: {e!r}"
+                    )
+                    continue
+                # a restarted llamafile's slots are empty whatever we thought
+                if not result.get("n_saved"):
+                    continue
+                manifest[filename] = {
+                    "template": prefix[0],
+                    "language": prefix[1],
+                    "model": self.model,
+                    "prompt": prompt_fingerprint(prefix),
+                    "saved": time.time(),
+                }
+                saved.add(prefix)
+                metrics.incr("slots_saved")
+        if saved:
+            self.write_manifest(manifest)
+            logger.info(f"Saved {len(saved)} slot cache(s) to {self.path}")
+
+    async def restore(self, backends: list[Backend]) -> None:
+        manifest = self.read_manifest()
+        restored: int = 0
+        # the most recently saved first, in case there are more than slots
+        for filename, entry in sorted(
+            manifest.items(), key=lambda item: item[1].get("saved", 0), reverse=True
+        ):
+            if not self.current(filename, entry):
+                logger.debug(f"Dropping stale slot cache {filename}")
+                (self.path / filename).unlink(missing_ok=True)
+                del manifest[filename]
+                continue
+            prefix: PromptPrefix = (str(entry["template"]), str(entry["language"]))
+            templates = trans_manager.get_templates(SupportedLanguage.Value(prefix[1]))
+            size: int = len(prompt_head(templates[prefix[0]]))
+            for backend in backends:
+                slot: int | None = backend.slots.assign(prefix, size)
+                if slot is None:
+                    continue
+                try:
+                    await backend.slot_action(slot, "restore", filename)
+                except httpx.HTTPError as e:
+                    logger.warning(
+                        f"Could not restore {filename} on {backend.name}: {e!r}"
+                    )
+                    backend.slots.forget(slot)
+                    continue
+                restored += 1
+                metrics.incr("slots_restored")
+        self.write_manifest(manifest)
+        if restored:
+            logger.info(f"Restored {restored} slot cache(s) from {self.path}")
@@ -1,46 +1,193 @@
 from __future__ import annotations
 
+import json
 import sys
+import time
 import xml.etree.ElementTree as ET
-from asyncio import CancelledError, Queue, QueueEmpty, sleep
+from asyncio import (
+    CancelledError,
+    Queue,
+    TaskGroup,
+    as_completed,
+    create_task,
+    gather,
+    sleep,
+    wait,
+)
+from functools import partial
+from string import Template
+from types import MappingProxyType
+from typing import Awaitable, Callable, Mapping
 from urllib.parse import urljoin
-from zipfile import ZipFile
 
 import httpx
 import openai_python_client.api.chat.create_chat_completion as api
-from openai_python_client import Client
 from openai_python_client.models.user_message import UserMessage
 from openai_python_client.models.user_message_role import UserMessageRole
 
-from .__init__ import LLAMAFILE_MODEL, LLAMAFILE_SIZE, logger
-from .health import AIHealth
+from .__init__ import (
+    LLAMAFILE_BACKEND_SLOTS,
+    LLAMAFILE_CTX_PER_SLOT,
+    LLAMAFILE_MODEL,
+    LLAMAFILE_PARALLEL,
+    LLAMAFILE_PORTS,
+    PIPELINE_MODE,
+    SLOT_CACHE_ENABLED,
+    SLOT_CACHE_PATH,
+    SPECULATIVE_CANDIDATES,
+    STORY_LENGTH_MODE,
+    VALIDATION_MODE,
+    WARMUP_LANGUAGES,
+    logger,
+)
+from . import metrics
+from .backends import Backend, BackendPool
+from .cache import LoreCache, SlotCache
+from .grammars import grammars
+from .health import AIHealth, llamafile_launches, llamafile_listening
 
 # generated by protoc
-from .job.job_pb2 import JobRequest, JobResponse, SupportedLanguage
+from .job.job_pb2 import JobProgress, JobRequest, JobResponse, SupportedLanguage
+from .server import JobRegistry
+from .slots import PromptPrefix, prompt_head
+from .retry import CHAT_ATTEMPTS, BackendUnavailable, backoff_delay
+from .routing import LanguageRouter
 from .templates import trans_manager
+from .validation import story_cut_off
 
 # ARGS
 HOST = "127.0.0.1"
-PORT = 50052
+PORTS = LLAMAFILE_PORTS
+# readiness probes start fast and back off while the model loads
+READY_PROBE_MIN: float = 0.05
+READY_PROBE_MAX: float = 2.0
+
+# Story length in sentences per RimWorld QualityCategory, used when the model
+# isn't asked or doesn't answer with a digit
+QUALITY_STORY_LENGTH: MappingProxyType[str, int] = MappingProxyType(
+    {
+        "Awful": 2,
+        "Poor": 3,
+        "Normal": 4,
+        "Good": 5,
+        "Excellent": 6,
+        "Masterwork": 8,
+        "Legendary": 9,
+    }
+)
+
+# Generation budgets in tokens, so a model that won't stop can't run on until
+# the context is full; the digit and yes/no grammars need a token or two
+DIGIT_MAX_TOKENS: int = 2
+YESNO_MAX_TOKENS: int = 2
+NAME_MAX_TOKENS: int = 32  # five words in quotes, with room for long compounds
+STORY_QUOTE_TOKENS: int = 8  # leading whitespace and the quotes around a story
+STORY_MAX_SENTENCES: int = 9  # the length grammar answers with a single digit
+# chat template markup around a prompt, plus slack for tokens merging where
+# the description meets the template
+PROMPT_OVERHEAD_TOKENS: int = 32
+
+# Rough upper bound of tokens per story sentence; scripts and inflected
+# languages the tokenizer splits finely cost more
+STORY_TOKENS_PER_SENTENCE: MappingProxyType[int, int] = MappingProxyType(
+    {
+        SupportedLanguage.ARABIC: 96,
+        SupportedLanguage.CHINESE_SIMPLIFIED: 72,
+        SupportedLanguage.CHINESE_TRADITIONAL: 88,
+        SupportedLanguage.CZECH: 72,
+        SupportedLanguage.ESTONIAN: 72,
+        SupportedLanguage.FINNISH: 72,
+        SupportedLanguage.HUNGARIAN: 80,
+        SupportedLanguage.JAPANESE: 96,
+        SupportedLanguage.KOREAN: 112,
+        SupportedLanguage.POLISH: 72,
+        SupportedLanguage.ROMANIAN: 64,
+        SupportedLanguage.RUSSIAN: 96,
+        SupportedLanguage.SLOVAK: 72,
+        SupportedLanguage.TURKISH: 72,
+        SupportedLanguage.UKRAINIAN: 112,
+    }
+)
+STORY_DEFAULT_TOKENS_PER_SENTENCE: int = 48
+
+
+def story_max_tokens(story_len: int, language: SupportedLanguage) -> int:
+    return STORY_QUOTE_TOKENS + story_len * STORY_TOKENS_PER_SENTENCE.get(
+        language, STORY_DEFAULT_TOKENS_PER_SENTENCE
+    )
 
 
 class AIClient:
-    def __init__(self, srv_host: str, srv_port: int):
+    def __init__(
+        self,
+        srv_host: str,
+        srv_ports: list[int],
+        lore_cache: LoreCache | None = None,
+    ):
         self.srv_host: str = srv_host
-        self.srv_port: int = srv_port
-        self.srv_url: str = f"http://{self.srv_host}:{self.srv_port}/v1"
+        self.srv_ports: list[int] = srv_ports
         self.health_interval: int = 15
         self.ai_health = AIHealth.UNKNOWN
-        self.grammar_quotes: str = (
-            ZipFile(sys.argv[0]).read("AIServer/schemas/quote.gbnf").decode("utf-8")
+        self.backends: BackendPool = BackendPool(
+            srv_host, srv_ports, LLAMAFILE_BACKEND_SLOTS
         )
-        self.grammar_digit: str = (
-            ZipFile(sys.argv[0]).read("AIServer/schemas/digit.gbnf").decode("utf-8")
+        # the structured call adds the name to the longest story
+        self.router: LanguageRouter = LanguageRouter(
+            self.backends,
+            lambda language: story_max_tokens(STORY_MAX_SENTENCES, language)
+            + NAME_MAX_TOKENS
+            + PROMPT_OVERHEAD_TOKENS,
         )
-        self.grammar_yesno: str = (
-            ZipFile(sys.argv[0]).read("AIServer/schemas/yesno.gbnf").decode("utf-8")
+        self.grammar_quotes: str = grammars["quote"]
+        self.grammar_digit: str = grammars["digit"]
+        self.grammar_yesno: str = grammars["yesno"]
+        self.grammar_lore: str = grammars["lore"]
+        self.story_lengths: dict[tuple[str, str, str, str], int] = {}
+        # shared with the server, which answers hits before queueing
+        self.lore_cache: LoreCache | None = lore_cache
+        self.slot_cache: SlotCache | None = (
+            SlotCache(SLOT_CACHE_PATH) if SLOT_CACHE_ENABLED else None
+        )
+
+    async def warm_up(self, languages: list[str]) -> None:
+        # Put each language's story template, up to its first field, into a
+        # slot on every backend so the first job only evaluates its own part
+        started: float = time.perf_counter()
+        if len(languages) > LLAMAFILE_BACKEND_SLOTS:
+            logger.warning(
+                f"Only warming up {LLAMAFILE_BACKEND_SLOTS} language(s),"
+                " one per slot"
+            )
+            languages = languages[:LLAMAFILE_BACKEND_SLOTS]
+        warmups: list[Awaitable[str]] = []
+        for name in languages:
+            language: SupportedLanguage = SupportedLanguage.Value(name)
+            templates: Mapping[str, Template] = trans_manager.get_templates(language)
+            key: str = await self.router.story_template_key(language, templates)
+            if all(
+                (key, name) in backend.slots.prefixes
+                for backend in self.backends.backends
+            ):
+                logger.debug(f"{name} was restored from the slot cache")
+                continue
+            warmups += [
+                # the digit grammar ends the reply after a single token
+                self.do_chat(
+                    prompt_head(templates[key]),
+                    grammar=self.grammar_digit,
+                    prefix=(key, name),
+                    max_tokens=DIGIT_MAX_TOKENS,
+                )
+                for _ in self.backends.backends
+            ]
+        await gather(*warmups)
+        logger.info(
+            f"Warmed up {', '.join(languages)} in {time.perf_counter() - started:.1f}s"
         )
 
+    async def close(self) -> None:
+        await self.backends.close()
+
     async def test_art_description_job(self) -> None:
         language: SupportedLanguage = SupportedLanguage.CHINESE_SIMPLIFIED
         hash_code: int = 0
@@ -78,40 +225,94 @@ class AIClient:
     async def start(
         self,
         input_queue: Queue[tuple[int, JobRequest]],
-        output_queue: Queue[tuple[int, JobResponse]],
+        registry: JobRegistry,
+        workers: int = LLAMAFILE_PARALLEL,
     ) -> None:
-        sleep_for: float = 0.5
+        # One worker per llamafile slot so continuous batching has work to batch
+        async with TaskGroup() as worker_group:
+            worker_group.create_task(self.monitor_health(), name="client_health")
+            for worker_id in range(workers):
+                worker_group.create_task(
+                    self.work(input_queue, registry),
+                    name=f"client_worker_{worker_id}",
+                )
 
+    async def work(
+        self,
+        input_queue: Queue[tuple[int, JobRequest]],
+        registry: JobRegistry,
+    ) -> None:
         while True:
-            try:
-                request_job_id: int
-                request: JobRequest
+            request_job_id: int
+            request: JobRequest
 
-                # Get a "work item" out of the queue.
-                request_job_id, request = input_queue.get_nowait()
+            # Wait for a "work item"; cancelling the worker interrupts this wait
+            request_job_id, request = await input_queue.get()
 
-                # switch supported request types
-                response: JobResponse = JobResponse()
-                response.job_id = request_job_id
+            # switch supported request types
+            response: JobResponse = JobResponse()
+            response.job_id = request_job_id
+            try:
                 match request.WhichOneof("job_payload"):  # type: ignore
                     case "art_description_job":
                         art_description_response = await self.do_art_description_job(
                             request.art_description_job,
                             request.language,
+                            (
+                                partial(
+                                    self.publish_art_progress, registry, request_job_id
+                                )
+                                if registry.is_streaming(request_job_id)
+                                else None
+                            ),
                         )
                         response.art_description_response.CopyFrom(  # type: ignore
                             art_description_response
                         )
                     case _:  # type: ignore
                         pass
+            except CancelledError:
+                # the client is going down, the RPC mustn't wait for it forever
+                registry.fail(request_job_id, BackendUnavailable("AI client stopped"))
+                raise
+            except BackendUnavailable as e:
+                # Fail the RPCs now instead of letting the queue back up
+                logger.error(f"Job {request_job_id} failed: {e}")
+                metrics.incr("jobs_failed")
+                registry.fail(request_job_id, e)
+                continue
+            except Exception as e:
+                # one bad job mustn't take the other workers' jobs down with it
+                logger.exception(f"Job {request_job_id} failed unexpectedly")
+                metrics.incr("jobs_failed")
+                registry.fail(request_job_id, e)
+                continue
+
+            # Hand the result straight to the waiting RPC
+            registry.resolve(response.job_id, response)
+
+    @staticmethod
+    def publish_art_progress(
+        registry: JobRegistry, job_id: int, delta: str, restart: bool
+    ) -> None:
+        registry.publish(
+            job_id,
+            JobProgress(
+                job_id=job_id,
+                art_description_progress=JobProgress.ArtDescriptionProgress(
+                    restart=restart,
+                    description_delta=delta,
+                ),
+            ),
+        )
 
-                # Put the result into the output queue
-                await output_queue.put((response.job_id, response))
-            except QueueEmpty:
-                # Sleep for the "sleep_for" seconds
-                await sleep(sleep_for)
+    async def do_art_description_length(
+        self, xml_def: str, locale: str, templates: Mapping[str, Template]
+    ) -> tuple[int, str]:
+        defin: str = "Art"
+        stuff: str = "Steel"
+        quality: str = "Good"
 
-    async def do_art_description_length(self, xml_def: str) -> tuple[int, str]:
         # Load language-specific templates
         try:
             # Parse XML and extract definitions
@@ -121,7 +322,7 @@ class AIClient:
             quality = xml_def_et.findtext("quality", default="Good")
 
             # Generate description using templates
-            short_desc_template = trans_manager.get_template("short_t")
+            short_desc_template = templates["short_t"]
             short_desc = short_desc_template.substitute(
                 defin=defin,
                 stuff=stuff,
@@ -131,106 +332,397 @@ class AIClient:
             short_desc = "Type: Art\nMaterial: Steel\nQuality: Good"
             print("Failed to parse XML definition.", file=sys.stderr)
 
+        # The length only depends on what the item is, so ask at most once per kind
+        length_key: tuple[str, str, str, str] = (
+            defin,
+            stuff,
+            quality,
+            str(LLAMAFILE_MODEL),
+        )
+        table_len: int = QUALITY_STORY_LENGTH.get(quality, 4)
+        story_len: int | None = self.story_lengths.get(length_key)
+        if story_len is None and STORY_LENGTH_MODE == "table":
+            story_len = table_len
+        if story_len is not None:
+            metrics.incr("length_calls_saved")
+            return story_len, short_desc
+
         # Retrieve story length
-        length_msg_template = trans_manager.get_template("length_t")
+        length_msg_template = templates["length_t"]
         message = length_msg_template.substitute(info=short_desc)
-        reply: str | None = await self.do_chat(message, grammar=self.grammar_digit)
-        return int(reply.strip()) if reply and reply.isdigit() else 4, short_desc
+        reply: str | None = await self.do_chat(
+            message,
+            grammar=self.grammar_digit,
+            prefix=("length_t", locale),
+            max_tokens=DIGIT_MAX_TOKENS,
+        )
+        story_len = int(reply.strip()) if reply and reply.isdigit() else table_len
+        self.story_lengths[length_key] = story_len
+        return story_len, short_desc
 
     async def do_art_description_story(
         self,
         language: SupportedLanguage,
+        templates: Mapping[str, Template],
         story_len: int,
         title: str,
         short_desc: str,
         description: str,
-    ) -> str:
-        # Generate story based on the size configuration
-        story_template_key = (
-            f"story_{'mini' if LLAMAFILE_SIZE is None else LLAMAFILE_SIZE}_t"
+        on_delta: Callable[[str], None] | None = None,
+        max_tokens: int | None = None,
+    ) -> tuple[str, str | None]:
+        story_template_key = await self.router.story_template_key(language, templates)
+        if max_tokens is None:
+            max_tokens = story_max_tokens(story_len, language)
+        story_msg = await self.story_prompt(
+            templates[story_template_key],
+            story_len,
+            title,
+            short_desc + "\n\n" + description,
+            max_tokens,
         )
-        # the below languages are not well supported by the tokenizer, so we must use the "small" description if using the "medium" model
-        if LLAMAFILE_SIZE == "medium" and language in [
-            SupportedLanguage.RUSSIAN,
-            SupportedLanguage.KOREAN,
-            SupportedLanguage.UKRAINIAN,
-            SupportedLanguage.HUNGARIAN,
-            SupportedLanguage.JAPANESE,
-        ]:
-            story_template_key = "story_small_t"
-        story_template = trans_manager.get_template(story_template_key)
-        story_msg = story_template.substitute(
-            len=story_len,
-            title=title,
-            description=short_desc + "\n\n" + description,
+        story, finish_reason = await self.do_chat_reply(
+            story_msg,
+            grammar=self.grammar_quotes,
+            on_delta=self.unquoted(on_delta) if on_delta else None,
+            prefix=(story_template_key, SupportedLanguage.Name(language)),
+            max_tokens=max_tokens,
         )
-        return await self.do_chat(story_msg, grammar=self.grammar_quotes) or description
+        return story or description, finish_reason
 
-    async def do_art_description_name(self, title: str, story: str) -> str:
-        # Determine name
-        name_template = trans_manager.get_template("name_t")
-        name_msg = name_template.substitute(pas=story)
-        return await self.do_chat(name_msg, grammar=self.grammar_quotes) or title
-
-    async def do_art_description_job(
+    async def do_art_description_structured(
         self,
-        art_job: JobRequest.ArtDescriptionJob,
         language: SupportedLanguage,
-    ) -> JobResponse.ArtDescriptionResponse:
-        hash_code: int = art_job.hash_code
-        title: str = art_job.title
-        description: str = art_job.description
-        xml_def: str = art_job.xml_def
+        templates: Mapping[str, Template],
+        story_len: int,
+        title: str,
+        short_desc: str,
+        description: str,
+    ) -> tuple[str, str] | None:
+        # Same prompt as the story, but the grammar makes the model name the
+        # piece in the same completion: {"story": "...", "title": "..."}
+        story_template_key = await self.router.story_template_key(language, templates)
+        # the JSON keys and punctuation fit in the quote allowance
+        max_tokens: int = story_max_tokens(story_len, language) + NAME_MAX_TOKENS
+        story_msg = await self.story_prompt(
+            templates[story_template_key],
+            story_len,
+            title,
+            short_desc + "\n\n" + description,
+            max_tokens,
+        )
+        reply: str = await self.do_chat(
+            story_msg,
+            grammar=self.grammar_lore,
+            prefix=(story_template_key, SupportedLanguage.Name(language)),
+            max_tokens=max_tokens,
+        )
+        try:
+            # lenient in case a raw control character gets past the grammar
+            lore = json.loads(reply, strict=False)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(lore, dict):
+            return None
+        story = lore.get("story")
+        name = lore.get("title")
+        if not isinstance(story, str) or not isinstance(name, str):
+            return None
+        if not story.strip() or not name.strip():
+            return None
+        return name.strip(), story.strip()
 
-        # Set language
-        trans_manager.set_locale(language)
+    async def story_prompt(
+        self,
+        template: Template,
+        story_len: int,
+        title: str,
+        description: str,
+        max_tokens: int,
+    ) -> str:
+        # The description comes from the game and can be any size. Shorten it
+        # so prompt and reply fit the slot's context, otherwise llamafile cuts
+        # the prompt itself or runs out of room halfway through the story
+        try:
+            # counted without the title so the count is shared between jobs,
+            # which can't take more tokens than it has characters
+            fixed: int = await self.backends.tokenize(
+                template.substitute(len=story_len, title="", description="")
+            )
+            allowed: int = (
+                LLAMAFILE_CTX_PER_SLOT
+                - max_tokens
+                - PROMPT_OVERHEAD_TOKENS
+                - fixed
+                - len(title)
+            )
+            if allowed < 0:
+                logger.warning("Story template alone doesn't fit the context")
+            description = await self.fit_tokens(description, allowed)
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning(f"Could not count prompt tokens, sending it whole: {e!r}")
+        return template.substitute(len=story_len, title=title, description=description)
 
-        # Determine length
-        story_len, short_desc = await self.do_art_description_length(xml_def)
+    async def fit_tokens(self, text: str, allowed: int) -> str:
+        # a token always covers at least one character
+        if len(text) <= allowed:
+            return text
+        tokens: int = await self.backends.tokenize(text)
+        if tokens > allowed:
+            metrics.incr("prompts_shortened")
+        while tokens > allowed and text:
+            # cut in proportion, back to the last word boundary if there is one
+            text = text[: max(0, len(text) * allowed // tokens)]
+            text = text.rsplit(maxsplit=1)[0] if len(text.split()) > 1 else text
+            tokens = await self.backends.tokenize(text) if text else 0
+        return text
 
-        # Determine story
-        story = await self.do_art_description_story(
+    async def do_art_description_name(
+        self, title: str, story: str, locale: str, templates: Mapping[str, Template]
+    ) -> str:
+        # Determine name
+        name_template = templates["name_t"]
+        name_msg = name_template.substitute(pas=story)
+        return (
+            await self.do_chat(
+                name_msg,
+                grammar=self.grammar_quotes,
+                prefix=("name_t", locale),
+                max_tokens=NAME_MAX_TOKENS,
+            )
+            or title
+        )
+
+    async def do_art_description_multi(
+        self,
+        language: SupportedLanguage,
+        locale: str,
+        templates: Mapping[str, Template],
+        story_len: int,
+        title: str,
+        short_desc: str,
+        description: str,
+        on_progress: Callable[[str, bool], None] | None = None,
+    ) -> tuple[str, str, bool]:
+        # Determine story, streaming it to the caller if they asked for progress
+        on_delta: Callable[[str], None] | None = (
+            partial(on_progress, restart=False) if on_progress else None
+        )
+        story, finish_reason = await self.do_art_description_story(
             language,
+            templates,
             story_len,
             title,
             short_desc,
             description,
+            on_delta,
         )
 
         # Strip quotes from story
-        new_story: str | None = await self.validate_art_description_story(story)
+        new_story: str | None = await self.validate_art_description_story(
+            story, language, finish_reason
+        )
+        # out of retries the raw reply is still better than nothing, but it
+        # mustn't be cached as if it were good
+        valid: bool = True
         tries: int = 5
+        max_tokens: int = story_max_tokens(story_len, language)
+        # what the router leaves room for in a slot, the longest story there is
+        max_tokens_limit: int = story_max_tokens(STORY_MAX_SENTENCES, language)
+        longest: str = story
         while new_story == None:
+            if finish_reason == "length":
+                # the same budget would only cut the story off again
+                if max_tokens >= max_tokens_limit:
+                    new_story = longest
+                    valid = False
+                    break
+                max_tokens = min(max_tokens * 2, max_tokens_limit)
+                metrics.incr("story_budget_raised")
+            if on_progress:
+                on_progress("", restart=True)
+            retry_story, finish_reason = await self.do_art_description_story(
+                language,
+                templates,
+                story_len,
+                title,
+                short_desc,
+                description,
+                on_delta,
+                max_tokens,
+            )
+            if finish_reason == "length":
+                longest = retry_story
             new_story = await self.validate_art_description_story(
-                await self.do_art_description_story(
-                    language, story_len, title, short_desc, description
-                )
+                retry_story, language, finish_reason
             )
             tries -= 1
-            if tries == 0:
+            if new_story is None and tries == 0:
                 new_story = story
+                valid = False
                 break
         story = new_story
 
         # Determine name
-        name = await self.do_art_description_name(title, story)
+        name = await self.do_art_description_name(title, story, locale, templates)
 
         # Strip quotes from name
         new_name: str | None = self.extract_quoted_string(name)
         tries: int = 5
         while new_name == None:
             new_name = self.extract_quoted_string(
-                await self.do_art_description_name(title, story)
+                await self.do_art_description_name(title, story, locale, templates)
             )
             tries -= 1
-            if tries == 0:
+            if new_name is None and tries == 0:
                 new_name = name
+                valid = False
                 break
         name = new_name
 
+        return name, story, valid
+
+    async def do_art_description_speculative(
+        self,
+        language: SupportedLanguage,
+        locale: str,
+        templates: Mapping[str, Template],
+        story_len: int,
+        title: str,
+        short_desc: str,
+        description: str,
+        on_progress: Callable[[str, bool], None] | None = None,
+    ) -> tuple[str, str, bool]:
+        # Streamed so that closing a losing candidate's connection makes
+        # llama.cpp drop it and free the slot; nobody reads the deltas
+        discard_delta: Callable[[str], None] = lambda delta: None
+
+        async def story_candidate() -> tuple[str, str | None]:
+            story, finish_reason = await self.do_art_description_story(
+                language,
+                templates,
+                story_len,
+                title,
+                short_desc,
+                description,
+                discard_delta,
+            )
+            return story, await self.validate_art_description_story(
+                story, language, finish_reason
+            )
+
+        story, story_valid = await self.first_valid(story_candidate)
+
+        async def name_candidate() -> tuple[str, str | None]:
+            name = await self.do_art_description_name(title, story, locale, templates)
+            return name, self.extract_quoted_string(name)
+
+        name, name_valid = await self.first_valid(name_candidate)
+
+        # candidates can't be streamed side by side, send the winner whole
+        if on_progress:
+            on_progress(story, restart=False)
+        return name, story, story_valid and name_valid
+
+    @staticmethod
+    async def first_valid(
+        candidate: Callable[[], Awaitable[tuple[str, str | None]]],
+        attempts: int = 6,
+    ) -> tuple[str, bool]:
+        # Same attempt budget as the sequential retries, spent
+        # SPECULATIVE_CANDIDATES at a time; falls back to the first raw reply,
+        # reported as not valid
+        first_reply: str | None = None
+        while attempts > 0:
+            wave = [
+                create_task(candidate())
+                for _ in range(min(SPECULATIVE_CANDIDATES, attempts))
+            ]
+            attempts -= len(wave)
+            try:
+                for next_done in as_completed(wave):
+                    reply, valid = await next_done
+                    if first_reply is None:
+                        first_reply = reply
+                    if valid is not None:
+                        metrics.incr(
+                            "candidates_cancelled", sum(not t.done() for t in wave)
+                        )
+                        return valid, True
+            finally:
+                for task in wave:
+                    task.cancel()
+                await gather(*wave, return_exceptions=True)
+        return first_reply or "", False
+
+    async def do_art_description_job(
+        self,
+        art_job: JobRequest.ArtDescriptionJob,
+        language: SupportedLanguage,
+        on_progress: Callable[[str, bool], None] | None = None,
+    ) -> JobResponse.ArtDescriptionResponse:
+        hash_code: int = art_job.hash_code
+        title: str = art_job.title
+        description: str = art_job.description
+        xml_def: str = art_job.xml_def
+
+        # Language-specific templates, owned by this job alone
+        templates: Mapping[str, Template] = trans_manager.get_templates(language)
+        locale: str = SupportedLanguage.Name(language)
+
+        # Determine length
+        story_len, short_desc = await self.do_art_description_length(
+            xml_def, locale, templates
+        )
+
+        # One constrained completion for story and name, the multi-call path
+        # if the model's answer doesn't parse
+        lore: tuple[str, str] | None = None
+        if PIPELINE_MODE == "single":
+            lore = await self.do_art_description_structured(
+                language, templates, story_len, title, short_desc, description
+            )
+            if lore is None:
+                metrics.incr("structured_fallbacks")
+            elif on_progress:
+                # the JSON isn't worth streaming, hand over the story in one piece
+                on_progress(lore[1], restart=False)
+        # only lore that passed validation is worth keeping for good
+        validated: bool = True
+        if lore is not None:
+            name, story = lore
+        elif SPECULATIVE_CANDIDATES > 1:
+            name, story, validated = await self.do_art_description_speculative(
+                language,
+                locale,
+                templates,
+                story_len,
+                title,
+                short_desc,
+                description,
+                on_progress,
+            )
+        else:
+            name, story, validated = await self.do_art_description_multi(
+                language,
+                locale,
+                templates,
+                story_len,
+                title,
+                short_desc,
+                description,
+                on_progress,
+            )
+
         # Replace all mentions of the old title with the new title in the story
         story = story.replace(title, name).strip()
 
+        if self.lore_cache is not None:
+            if validated:
+                self.lore_cache.put(LoreCache.key(art_job, language), name, story)
+            else:
+                metrics.incr("lore_cache_skipped")
+
         # Return result
         return JobResponse.ArtDescriptionResponse(
             hash_code=hash_code,
@@ -240,8 +732,28 @@ class AIClient:
         )
 
     async def do_chat(
-        self, content: str, grammar: str | None = None, fallback: int | None = None
+        self,
+        content: str,
+        grammar: str | None = None,
+        on_delta: Callable[[str], None] | None = None,
+        prefix: PromptPrefix | None = None,
+        max_tokens: int | None = None,
     ) -> str:
+        reply, _ = await self.do_chat_reply(
+            content, grammar, on_delta, prefix, max_tokens
+        )
+        return reply
+
+    # Like do_chat, but also returns why llama.cpp stopped: "stop" on EOS or a
+    # stop word, "length" when it ran out of tokens
+    async def do_chat_reply(
+        self,
+        content: str,
+        grammar: str | None = None,
+        on_delta: Callable[[str], None] | None = None,
+        prefix: PromptPrefix | None = None,
+        max_tokens: int | None = None,
+    ) -> tuple[str, str | None]:
         message: UserMessage = UserMessage(
             role=UserMessageRole.USER,
             content=content.strip(),
@@ -251,12 +763,17 @@ class AIClient:
             model=str(LLAMAFILE_MODEL),
             temperature=0.7,
         )
+        if max_tokens is not None:
+            request.max_tokens = max_tokens
 
         # additional properties
         if grammar:
             request.additional_properties["grammar"] = grammar
         request.additional_properties["dynatemp_range"] = 0.3
         request.additional_properties["repeat_penalty"] = 1.05
+        # reuse the KV cache for the prompt prefix shared with the previous
+        # request on the slot; story templates keep their variable parts last
+        request.additional_properties["cache_prompt"] = True
         request.additional_properties["stop"] = (
             [  # conditions which should cause the model to stop generating, normal or abnormal
                 "<|end|>",
@@ -269,88 +786,287 @@ class AIClient:
             ]
         )
 
-        logger.debug(f"Request:\n{request.to_dict()}")
-        response: api.CreateChatCompletionResponse | None = await api.asyncio(
-            client=self.client,
-            body=request,
-        )
-        if not response:
-            if fallback:
-                if fallback != 0:
-                    fallback -= 1
-                    return await self.do_chat(content, grammar, fallback)
-                else:
-                    return ""
+        # Deltas can't be taken back, so a stream is only retried if it failed
+        # before sending any
+        streamed: bool = False
+
+        def forward(delta: str) -> None:
+            nonlocal streamed
+            streamed = True
+            on_delta(delta)
+
+        reply: str | None = None
+        finish_reason: str | None = None
+        backend: Backend | None = None
+        for attempt in range(CHAT_ATTEMPTS):
+            if attempt > 0:
+                metrics.incr("chat_retries")
+                await sleep(backoff_delay(attempt - 1))
+            # least loaded llamafile whose circuit is closed, fail fast if none;
+            # a retry prefers one that wasn't just tried
+            backend = self.backends.pick(avoid=backend)
+            metrics.incr("chat_calls")
+
+            # keep prompts sharing a template on the slot that already cached it
+            id_slot: int = backend.slots.acquire(prefix, len(message.content))
+            request.additional_properties["id_slot"] = id_slot
+
+            logger.debug(f"Request to {backend.name}:\n{request.to_dict()}")
+            reply, finish_reason = None, None
+            started: float = time.perf_counter()
+            try:
+                with self.backends.use(backend):
+                    if on_delta is not None:
+                        reply, finish_reason = await self.do_chat_stream(
+                            backend, request, forward
+                        )
+                    else:
+                        response: api.CreateChatCompletionResponse | None = (
+                            await api.asyncio(client=backend.client, body=request)
+                        )
+                        if response:
+                            logger.debug(f"Response:\n{response.to_dict()}")
+                            self.record_timings(
+                                response.additional_properties.get("timings")
+                            )
+                            reply = response.choices[0].message.content or ""
+                            finish_reason = response.choices[0].finish_reason.value
+            except httpx.TransportError as e:
+                logger.warning(f"Chat request to {backend.name} failed: {e!r}")
+            finally:
+                backend.slots.release(id_slot)
+
+            # no reply at all means llamafile failed, an empty one that the
+            # model had nothing to say
+            if reply is None:
+                backend.breaker.record_failure()
             else:
-                return ""
-        logger.debug(f"Response:\n{response.to_dict()}")
-        reply: str | None = response.choices[0].message.content
+                # failed and cancelled calls say nothing about how fast it is
+                backend.record_latency(time.perf_counter() - started)
+                backend.breaker.record_success()
+                if reply:
+                    break
+            if streamed:
+                break
+        else:
+            metrics.incr("chat_gave_up")
+
+        if reply is None:
+            raise BackendUnavailable(
+                f"llamafile didn't answer after {CHAT_ATTEMPTS} attempts"
+            )
+        if finish_reason == "length":
+            metrics.incr("chat_truncated")
         if not reply:
-            if fallback:
-                if fallback != 0:
-                    fallback -= 1
-                    return await self.do_chat(content, grammar, fallback)
-                else:
-                    return ""
-            else:
-                return ""
+            return "", None
         if "<|end|>" in reply:
             reply = reply.replace("<|end|>", "")
         if "<|endoftext|>" in reply:
             reply = reply.replace("<|endoftext|>", "")
         if "<|im_end|>" in reply:
             reply = reply.replace("<|im_end|>", "")
-        return reply.strip()
+        return reply.strip(), finish_reason
+
+    async def do_chat_stream(
+        self,
+        backend: Backend,
+        request: api.CreateChatCompletionRequest,
+        on_delta: Callable[[str], None],
+    ) -> tuple[str | None, str | None]:
+        request.stream = True
+        parts: list[str] = []
+        finish_reason: str | None = None
+        async with backend.client.get_async_httpx_client().stream(
+            "POST", "/chat/completions", json=request.to_dict()
+        ) as r:
+            if r.status_code != 200:
+                return None, None
+            # server-sent events, one completion chunk per "data:" line
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line.removeprefix("data:").strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed stream chunk: {data!r}")
+                    continue
+                if not isinstance(chunk, dict):
+                    continue
+                # llama.cpp attaches timings to the final chunk
+                self.record_timings(chunk.get("timings"))
+                choices = chunk.get("choices") or [{}]
+                delta: str | None = choices[0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_delta(delta)
+                finish_reason = choices[0].get("finish_reason") or finish_reason
+        reply: str = "".join(parts)
+        logger.debug(f"Streamed response:\n{reply}")
+        return reply, finish_reason
+
+    # llama.cpp reports how many prompt tokens it actually had to evaluate;
+    # with cache_prompt the shared template prefix is skipped on later jobs
+    @staticmethod
+    def record_timings(timings: dict | None) -> None:
+        if not timings:
+            return
+        metrics.incr("prompt_tokens_evaluated", int(timings.get("prompt_n", 0)))
+        metrics.incr("prompt_eval_ms", round(timings.get("prompt_ms", 0)))
 
     # GET /health: Returns the current state of the server:
     # * {"status": "loading model"} if the model is still being loaded.
     # * {"status": "error"} if the model failed to load.
     # * {"status": "ok"} if the model is successfully loaded and the server is ready for further requests mentioned below.
     async def check_ai_health(self) -> None:
+        for backend in self.backends.backends:
+            await self.check_backend_health(backend)
+        # usable as long as one backend is
+        self.ai_health = (
+            AIHealth.HEALTHY
+            if self.backends.healthy()
+            else self.backends.backends[0].ai_health
+        )
+
+    async def check_backend_health(self, backend: Backend) -> None:
         try:
-            self.client: Client = Client(self.srv_url, verify_ssl=False)
-            r = await self.client.get_async_httpx_client().get(
-                url=urljoin(self.srv_url, "/health"), timeout=5
+            r = await backend.client.get_async_httpx_client().get(
+                url=urljoin(backend.url, "/health"), timeout=5
             )
             if r.status_code == 200:
                 json_data = r.json()
                 logger.debug(json_data)
-                status = json_data.get("status", "")
+                status = (
+                    json_data.get("status", "") if isinstance(json_data, dict) else ""
+                )
                 if status == "loading model":
-                    self.ai_health = AIHealth.STARTING
+                    backend.ai_health = AIHealth.STARTING
                 elif status == "error":
-                    self.ai_health = AIHealth.ERROR
+                    backend.ai_health = AIHealth.ERROR
                 elif status == "ok":
-                    self.ai_health = AIHealth.HEALTHY
+                    backend.ai_health = AIHealth.HEALTHY
                 else:
-                    self.ai_health = AIHealth.UNKNOWN
+                    backend.ai_health = AIHealth.UNKNOWN
             else:
-                self.ai_health = AIHealth.ERROR
+                backend.ai_health = AIHealth.ERROR
+        # only when it goes offline, readiness probes fail many times in a row
         except httpx.ConnectError:
-            logger.error("HealthCheck: ConnectException")
-            self.ai_health = AIHealth.OFFLINE
+            if backend.ai_health != AIHealth.OFFLINE:
+                logger.error(f"HealthCheck {backend.name}: ConnectException")
+            backend.ai_health = AIHealth.OFFLINE
         except httpx.ReadError:
-            logger.error("HealthCheck: ReadException")
-            self.ai_health = AIHealth.OFFLINE
+            if backend.ai_health != AIHealth.OFFLINE:
+                logger.error(f"HealthCheck {backend.name}: ReadException")
+            backend.ai_health = AIHealth.OFFLINE
         except httpx.TimeoutException:
-            logger.error("HealthCheck: TimeoutException")
-            self.ai_health = AIHealth.OFFLINE
-        # Because we're using a grammar, we can expect something like /^\s*\".*\"\s*$/
+            if backend.ai_health != AIHealth.OFFLINE:
+                logger.error(f"HealthCheck {backend.name}: TimeoutException")
+            backend.ai_health = AIHealth.OFFLINE
+        # a dropped connection or a garbled reply, a probe must never raise
+        except (httpx.HTTPError, ValueError) as e:
+            if backend.ai_health != AIHealth.OFFLINE:
+                logger.error(f"HealthCheck {backend.name}: {e!r}")
+            backend.ai_health = AIHealth.OFFLINE
 
-    async def validate_art_description_story(self, s: str) -> str | None:
+    async def wait_ready(self) -> None:
+        # However long the model takes to load, the server queues jobs meanwhile
+        delay: float = READY_PROBE_MIN
+        while True:
+            await self.check_ai_health()
+            if self.ai_health == AIHealth.HEALTHY:
+                # restarts from here on leave the slots empty
+                for backend in self.backends.backends:
+                    backend.launch = llamafile_launches[backend.port]
+                return
+            # a llamafile saying it listens is worth probing right away
+            announcements = [
+                create_task(llamafile_listening[backend.port].wait())
+                for backend in self.backends.backends
+                if not llamafile_listening[backend.port].is_set()
+            ]
+            if announcements:
+                await wait(announcements, timeout=delay)
+                for announcement in announcements:
+                    announcement.cancel()
+            else:
+                await sleep(delay)
+            delay = min(delay * 2, READY_PROBE_MAX)
+
+    async def monitor_health(self) -> None:
+        # backends still loading at startup join the pool once they're up
+        while True:
+            await sleep(self.health_interval)
+            was: list[AIHealth] = [
+                backend.ai_health for backend in self.backends.backends
+            ]
+            await self.check_ai_health()
+            for backend, health in zip(self.backends.backends, was):
+                if backend.ai_health == AIHealth.HEALTHY and (
+                    health != AIHealth.HEALTHY
+                    or backend.launch != llamafile_launches[backend.port]
+                ):
+                    await self.recover(backend)
+
+    async def recover(self, backend: Backend) -> None:
+        # a llamafile that was down or restarted, even between two checks,
+        # may have lost every slot, so start over as at startup
+        logger.info(f"{backend.name} is back, restoring its slot caches")
+        backend.slots.reset()
+        backend.launch = llamafile_launches[backend.port]
+        if self.slot_cache is not None:
+            await self.slot_cache.restore([backend])
+
+    async def validate_art_description_story(
+        self,
+        s: str,
+        language: SupportedLanguage,
+        finish_reason: str | None = None,
+    ) -> str | None:
         new_story: str | None = self.extract_quoted_string(s)
         if new_story is None:
             return None
+        # Tell a cut off story by how llama.cpp stopped and how it ends, and
+        # only ask the model when that's inconclusive
+        if VALIDATION_MODE != "llm":
+            cut_off: bool | None = story_cut_off(new_story, language, finish_reason)
+            if cut_off is not None or VALIDATION_MODE == "local":
+                metrics.incr("validation_calls_saved")
+                return None if cut_off else new_story
         msg = f"Is the below content cut off at the end? Please answer Yes or No.\n\n{new_story}"
-        resp = await self.do_chat(msg, grammar=self.grammar_yesno)
+        resp = await self.do_chat(
+            msg,
+            grammar=self.grammar_yesno,
+            prefix=("validate", ""),
+            max_tokens=YESNO_MAX_TOKENS,
+        )
         if resp.strip() == "Yes":
             return None
         return new_story
 
+    @staticmethod
+    def unquoted(on_delta: Callable[[str], None]) -> Callable[[str], None]:
+        # The quote grammar wraps the story in whitespace and quotes, which the
+        # caller shouldn't see; it also forbids quotes inside the story
+        started: bool = False
+
+        def forward(delta: str) -> None:
+            nonlocal started
+            text = delta.replace('"', "")
+            if not started:
+                text = text.lstrip()
+                started = bool(text)
+            if text:
+                on_delta(text)
+
+        return forward
+
     @staticmethod
     def extract_quoted_string(s: str) -> str | None:
         import re
 
+        # Because we're using a grammar, we can expect something like /^\s*\".*\"\s*$/
         pattern = r"^[ \t]*\"([^\"]+)\"[ \t]*$"
         match = re.match(pattern, s)
         if match:
@@ -360,21 +1076,37 @@ class AIClient:
 
 async def run(
     input_queue: Queue[tuple[int, JobRequest]],
-    output_queue: Queue[tuple[int, JobResponse]],
+    registry: JobRegistry,
+    lore_cache: LoreCache | None = None,
 ):
     global client
-    client = AIClient(HOST, PORT)
-    tries = 0
+    client = AIClient(HOST, PORTS, lore_cache)
+    started: float = time.perf_counter()
     try:
-        while client.ai_health != AIHealth.HEALTHY:
-            if tries == 5:
-                raise ConnectionError("Failed 5 times to connect to llamafile")
-            await client.check_ai_health()
-            tries += 1
-            await sleep(5)
+        await client.wait_ready()
+        logger.info(
+            f"llamafile ready after {time.perf_counter() - started:.1f}s,"
+            f" {input_queue.qsize()} job(s) queued"
+        )
         # await client.test_art_description_job()
-        logger.info(f"Client connected to {HOST}:{PORT}")
-        await client.start(input_queue, output_queue)
+        if client.slot_cache is not None:
+            await client.slot_cache.restore(client.backends.backends)
+        if WARMUP_LANGUAGES:
+            try:
+                await client.warm_up(WARMUP_LANGUAGES)
+            except BackendUnavailable as e:
+                logger.warning(f"Skipping warmup: {e}")
+            else:
+                # the slots hold just the prompt heads until the first jobs
+                if client.slot_cache is not None:
+                    await client.slot_cache.save(client.backends.backends)
+        logger.info(
+            f"Client connected to {HOST}:{','.join(map(str, PORTS))}"
+            f" with {LLAMAFILE_PARALLEL} worker(s)"
+        )
+        await client.start(input_queue, registry)
     except CancelledError:
-        await client.client.get_async_httpx_client().aclose()
         logger.info("Client gracefully shut down")
+    finally:
+        # also when the supervisor is about to restart us with a new client
+        await client.close()
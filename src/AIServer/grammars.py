@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from importlib.resources import files
+from importlib.resources.abc import Traversable
+
+from .__init__ import logger
+
+
+class GrammarRegistry:
+    """GBNF grammars by name, read once from the package's schemas directory.
+
+    Goes through importlib.resources, so it works the same from the pyz, a
+    source checkout or an installed package. Drop a new schemas/<name>.gbnf
+    in and it is available as grammars["<name>"]."""
+
+    def __init__(self, schemas: Traversable):
+        self.grammars: dict[str, str] = {}
+        for entry in schemas.iterdir():
+            if entry.is_file() and entry.name.endswith(".gbnf"):
+                self.register(
+                    entry.name.removesuffix(".gbnf"),
+                    entry.read_text(encoding="utf-8"),
+                )
+        logger.debug(f"Loaded grammars: {', '.join(sorted(self.grammars))}")
+
+    def register(self, name: str, grammar: str) -> None:
+        # llamafile parses the grammar on every request, stray whitespace
+        # around it only costs bytes on the wire
+        self.grammars[name] = grammar.strip()
+
+    def __getitem__(self, name: str) -> str:
+        return self.grammars[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.grammars
+
+
+grammars = GrammarRegistry(files(__package__) / "schemas")
@@ -1,3 +1,5 @@
+from asyncio import Event
+from collections import Counter, defaultdict
 from enum import Enum
 
 
@@ -25,6 +27,13 @@ class AIHealth(Enum):
     UNKNOWN = 5
     NULL = 99
 
+# set by the supervisor once a llamafile says its server is listening, by
+# port, so the client probes it right away instead of at its next interval
+llamafile_listening: defaultdict[int, Event] = defaultdict(Event)
+# how many times the supervisor has started a llamafile, by port, so the
+# client can tell a restart from a backend that was only briefly unreachable
+llamafile_launches: Counter[int] = Counter()
+
 Health = {
     "Server": ServerHealth.UNKNOWN,
     "Client": ClientHealth.UNKNOWN,
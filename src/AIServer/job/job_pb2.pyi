@@ -1,9 +1,10 @@
 from google.protobuf import duration_pb2 as _duration_pb2
 from google.protobuf import timestamp_pb2 as _timestamp_pb2
+from google.protobuf.internal import containers as _containers
 from google.protobuf.internal import enum_type_wrapper as _enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
-from typing import ClassVar as _ClassVar, Mapping as _Mapping, Optional as _Optional, Union as _Union
+from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Mapping, Optional as _Optional, Union as _Union
 
 DESCRIPTOR: _descriptor.FileDescriptor
 
@@ -87,6 +88,12 @@ class JobRequest(_message.Message):
     art_description_job: JobRequest.ArtDescriptionJob
     def __init__(self, job_id: _Optional[int] = ..., time: _Optional[_Union[_timestamp_pb2.Timestamp, _Mapping]] = ..., language: _Optional[_Union[SupportedLanguage, str]] = ..., art_description_job: _Optional[_Union[JobRequest.ArtDescriptionJob, _Mapping]] = ...) -> None: ...
 
+class JobBatchRequest(_message.Message):
+    __slots__ = ("jobs",)
+    JOBS_FIELD_NUMBER: _ClassVar[int]
+    jobs: _containers.RepeatedCompositeFieldContainer[JobRequest]
+    def __init__(self, jobs: _Optional[_Iterable[_Union[JobRequest, _Mapping]]] = ...) -> None: ...
+
 class JobResponse(_message.Message):
     __slots__ = ("job_id", "duration", "language", "art_description_response")
     class ArtDescriptionResponse(_message.Message):
@@ -109,3 +116,20 @@ class JobResponse(_message.Message):
     language: SupportedLanguage
     art_description_response: JobResponse.ArtDescriptionResponse
     def __init__(self, job_id: _Optional[int] = ..., duration: _Optional[_Union[_duration_pb2.Duration, _Mapping]] = ..., language: _Optional[_Union[SupportedLanguage, str]] = ..., art_description_response: _Optional[_Union[JobResponse.ArtDescriptionResponse, _Mapping]] = ...) -> None: ...
+
+class JobProgress(_message.Message):
+    __slots__ = ("job_id", "art_description_progress", "response")
+    class ArtDescriptionProgress(_message.Message):
+        __slots__ = ("restart", "description_delta")
+        RESTART_FIELD_NUMBER: _ClassVar[int]
+        DESCRIPTION_DELTA_FIELD_NUMBER: _ClassVar[int]
+        restart: bool
+        description_delta: str
+        def __init__(self, restart: bool = ..., description_delta: _Optional[str] = ...) -> None: ...
+    JOB_ID_FIELD_NUMBER: _ClassVar[int]
+    ART_DESCRIPTION_PROGRESS_FIELD_NUMBER: _ClassVar[int]
+    RESPONSE_FIELD_NUMBER: _ClassVar[int]
+    job_id: int
+    art_description_progress: JobProgress.ArtDescriptionProgress
+    response: JobResponse
+    def __init__(self, job_id: _Optional[int] = ..., art_description_progress: _Optional[_Union[JobProgress.ArtDescriptionProgress, _Mapping]] = ..., response: _Optional[_Union[JobResponse, _Mapping]] = ...) -> None: ...
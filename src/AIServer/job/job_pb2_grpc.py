@@ -45,6 +45,16 @@ class JobManagerStub(object):
                 request_serializer=job__pb2.JobRequest.SerializeToString,
                 response_deserializer=job__pb2.JobResponse.FromString,
                 _registered_method=True)
+        self.JobServiceStream = channel.unary_stream(
+                '/job.JobManager/JobServiceStream',
+                request_serializer=job__pb2.JobRequest.SerializeToString,
+                response_deserializer=job__pb2.JobProgress.FromString,
+                _registered_method=True)
+        self.JobServiceBatch = channel.unary_stream(
+                '/job.JobManager/JobServiceBatch',
+                request_serializer=job__pb2.JobBatchRequest.SerializeToString,
+                response_deserializer=job__pb2.JobResponse.FromString,
+                _registered_method=True)
 
 
 class JobManagerServicer(object):
@@ -56,6 +66,21 @@ class JobManagerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def JobServiceStream(self, request, context):
+        """Same job, but progress is streamed while it runs and the finished
+        JobResponse is always the last message
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def JobServiceBatch(self, request, context):
+        """Queue many jobs at once, responses arrive in completion order
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_JobManagerServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -64,6 +89,16 @@ def add_JobManagerServicer_to_server(servicer, server):
                     request_deserializer=job__pb2.JobRequest.FromString,
                     response_serializer=job__pb2.JobResponse.SerializeToString,
             ),
+            'JobServiceStream': grpc.unary_stream_rpc_method_handler(
+                    servicer.JobServiceStream,
+                    request_deserializer=job__pb2.JobRequest.FromString,
+                    response_serializer=job__pb2.JobProgress.SerializeToString,
+            ),
+            'JobServiceBatch': grpc.unary_stream_rpc_method_handler(
+                    servicer.JobServiceBatch,
+                    request_deserializer=job__pb2.JobBatchRequest.FromString,
+                    response_serializer=job__pb2.JobResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'job.JobManager', rpc_method_handlers)
@@ -101,3 +136,57 @@ class JobManager(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def JobServiceStream(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/job.JobManager/JobServiceStream',
+            job__pb2.JobRequest.SerializeToString,
+            job__pb2.JobProgress.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def JobServiceBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/job.JobManager/JobServiceBatch',
+            job__pb2.JobBatchRequest.SerializeToString,
+            job__pb2.JobResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
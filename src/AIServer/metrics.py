@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from asyncio import CancelledError, sleep
+from collections import Counter
+
+from .__init__ import logger
+
+REPORT_INTERVAL = 300
+
+# Process-wide event counters, e.g. coalesced jobs or cache hits
+counters: Counter[str] = Counter()
+
+
+def incr(name: str, amount: int = 1) -> None:
+    counters[name] += amount
+
+
+def report() -> None:
+    if counters:
+        logger.info(
+            "Metrics: "
+            + ", ".join(f"{name}={count}" for name, count in sorted(counters.items()))
+        )
+
+
+async def run(interval: int = REPORT_INTERVAL):
+    reported: Counter[str] = Counter()
+    try:
+        while True:
+            await sleep(interval)
+            # stay quiet while nothing is happening
+            if counters != reported:
+                report()
+                reported = counters.copy()
+    except CancelledError:
+        report()
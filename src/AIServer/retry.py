@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import random
+import time
+
+from . import metrics
+from .__init__ import logger
+
+CHAT_ATTEMPTS = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+
+
+class BackendUnavailable(ConnectionError):
+    """llamafile couldn't be reached or kept failing; the job can't be done now."""
+
+
+def backoff_delay(attempt: int) -> float:
+    # "full jitter", so workers retrying together don't hit llamafile in step
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+class CircuitBreaker:
+    """Holds chat calls back from a llamafile after repeated failures.
+
+    Once FAILURE_THRESHOLD calls in a row failed the circuit opens and no
+    call is let through until RESET_TIMEOUT has passed. After that calls go
+    through again as probes: a success closes the circuit, a failure opens it
+    for another RESET_TIMEOUT."""
+
+    def __init__(
+        self,
+        name: str = "llamafile",
+        failure_threshold: int = FAILURE_THRESHOLD,
+        reset_timeout: float = RESET_TIMEOUT,
+    ):
+        self.name: str = name
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failures: int = 0
+        self.opened_at: float | None = None
+
+    def allows(self) -> bool:
+        if self.opened_at is None:
+            return True
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"{self.name} answered again, closing the circuit")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures < self.failure_threshold:
+            return
+        if self.opened_at is None:
+            metrics.incr("circuit_opened")
+            logger.warning(
+                f"{self.name} failed {self.failures} times in a row, opening the circuit"
+            )
+        self.opened_at = time.monotonic()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from string import Template
+from typing import Callable, Mapping
+
+import httpx
+
+from . import metrics
+from .__init__ import LLAMAFILE_CTX_PER_SLOT, LLAMAFILE_SIZE, logger
+from .backends import BackendPool
+from .job.job_pb2 import SupportedLanguage
+from .retry import BackendUnavailable
+from .templates import trans_manager
+
+# story templates from the most to the least demanding
+STORY_SIZES: tuple[str, ...] = ("medium", "small", "mini")
+# a language may cost this many times the tokens English does for the same
+# template before it is moved to the next smaller one
+TOKEN_COST_LIMIT: float = 1.75
+# what the medium model's tokenizer was known to handle badly, used until
+# a language has been measured
+POORLY_TOKENIZED: frozenset[SupportedLanguage] = frozenset(
+    {
+        SupportedLanguage.RUSSIAN,
+        SupportedLanguage.KOREAN,
+        SupportedLanguage.UKRAINIAN,
+        SupportedLanguage.HUNGARIAN,
+        SupportedLanguage.JAPANESE,
+    }
+)
+
+
+class LanguageRouter:
+    """Picks the story template for each language by what it costs to generate.
+
+    A translated template is the same text in every language, so the tokens
+    llamafile's /tokenize makes of it show how well the model's tokenizer
+    handles that language. Languages that take far more tokens than English,
+    or wouldn't fit a slot's context, step down to a smaller template. Each
+    language is measured once, on first use."""
+
+    def __init__(
+        self,
+        backends: BackendPool,
+        story_budget: Callable[[SupportedLanguage], int],
+    ):
+        self.backends: BackendPool = backends
+        # the longest story the model may write in a language, on top of the prompt
+        self.story_budget: Callable[[SupportedLanguage], int] = story_budget
+        self.size: str = "mini" if LLAMAFILE_SIZE is None else LLAMAFILE_SIZE
+        self.routes: dict[SupportedLanguage, str] = {}
+
+    async def story_template_key(
+        self, language: SupportedLanguage, templates: Mapping[str, Template]
+    ) -> str:
+        route: str | None = self.routes.get(language)
+        if route is not None:
+            return route
+        try:
+            route = await self.measure(language, templates)
+        except (httpx.HTTPError, KeyError, ValueError, BackendUnavailable) as e:
+            # not cached, the next job for the language measures again
+            logger.warning(
+                f"Could not measure {SupportedLanguage.Name(language)} tokens: {e!r}"
+            )
+            metrics.incr("routing_fallbacks")
+            return self.fallback(language)
+        self.routes[language] = route
+        return route
+
+    def fallback(self, language: SupportedLanguage) -> str:
+        if self.size == "medium" and language in POORLY_TOKENIZED:
+            return "story_small_t"
+        return f"story_{self.size}_t"
+
+    async def measure(
+        self, language: SupportedLanguage, templates: Mapping[str, Template]
+    ) -> str:
+        native: Mapping[str, Template] = trans_manager.get_templates(
+            SupportedLanguage.ENGLISH
+        )
+        sizes: tuple[str, ...] = STORY_SIZES[STORY_SIZES.index(self.size) :]
+        for size in sizes:
+            key: str = f"story_{size}_t"
+            if size == sizes[-1]:
+                # nothing smaller to go to
+                break
+            tokens: int = await self.backends.tokenize(templates[key].template)
+            native_tokens: int = await self.backends.tokenize(native[key].template)
+            cost: float = tokens / max(native_tokens, 1)
+            fits: bool = tokens + self.story_budget(language) <= LLAMAFILE_CTX_PER_SLOT
+            logger.debug(
+                f"{SupportedLanguage.Name(language)} {key}: {tokens} tokens,"
+                f" {tokens / max(len(templates[key].template), 1):.2f} per character,"
+                f" {cost:.2f}x English"
+            )
+            if cost <= TOKEN_COST_LIMIT and fits:
+                break
+        logger.info(f"Routing {SupportedLanguage.Name(language)} stories to {key}")
+        return key
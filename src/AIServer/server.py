@@ -1,20 +1,35 @@
 from __future__ import annotations
 
-from asyncio import CancelledError, Queue, QueueEmpty, sleep
+from asyncio import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    Queue,
+    get_running_loop,
+    wait,
+)
 from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pprint import pformat
+from typing import TYPE_CHECKING, AsyncIterator
 
 from google.protobuf.duration_pb2 import Duration
 from google.protobuf.timestamp_pb2 import Timestamp
+from grpc import StatusCode
 from grpc.aio import RpcContext, server
 
+from . import metrics
 from .__init__ import logger
+from .retry import BackendUnavailable
 
 # generated by protoc
-from .job.job_pb2 import JobRequest, JobResponse
+from .job.job_pb2 import JobBatchRequest, JobProgress, JobRequest, JobResponse
 from .job.job_pb2_grpc import JobManagerServicer, add_JobManagerServicer_to_server
 
+if TYPE_CHECKING:
+    # cache needs settings that aren't parsed yet when this module loads
+    from .cache import LoreCache
+
 # from .client import client
 # from .health import AIHealth
 
@@ -28,52 +43,300 @@ HOST = "127.0.0.1"
 PORT = 50051
 
 
+class JobRegistry:
+    """Maps in-flight job ids to the future their RPC is waiting on.
+
+    Identical jobs that are in flight at the same time share one generation:
+    only the first (the leader) is queued for the client, and its result is
+    fanned out to every RPC that registered the same job meanwhile."""
+
+    def __init__(self):
+        self.pending: dict[int, Future[JobResponse]] = {}
+        # progress for streaming RPCs, None marks the end of the stream
+        self.streams: dict[int, Queue[JobProgress | None]] = {}
+        # job key -> ids waiting on it, and queued leader id -> job key
+        self.flights: dict[bytes, list[int]] = {}
+        self.leaders: dict[int, bytes] = {}
+        # waiting id -> job key, so an RPC going away finds its flight
+        self.keys: dict[int, bytes] = {}
+
+    @staticmethod
+    def job_key(request: JobRequest) -> bytes:
+        # Everything but job_id and time decides what gets generated
+        payload: str | None = request.WhichOneof("job_payload")  # type: ignore
+        key = JobRequest(language=request.language)
+        if payload is not None:
+            getattr(key, payload).CopyFrom(getattr(request, payload))
+        return key.SerializeToString(deterministic=True)
+
+    def register(
+        self, request: JobRequest, stream: bool = False
+    ) -> tuple[Future[JobResponse], bool]:
+        """Returns the future to await and whether the job still needs queueing."""
+        job_id: int = request.job_id
+        if job_id in self.pending or job_id in self.leaders:
+            raise KeyError(f"Job {job_id} is already in flight")
+        future: Future[JobResponse] = get_running_loop().create_future()
+        self.pending[job_id] = future
+        if stream:
+            self.streams[job_id] = Queue()
+
+        key: bytes = JobRegistry.job_key(request)
+        self.keys[job_id] = key
+        waiting: list[int] | None = self.flights.get(key)
+        if waiting is not None:
+            waiting.append(job_id)
+            metrics.incr("jobs_coalesced")
+            logger.debug(f"Coalesced job {job_id} into an identical in-flight job")
+            return future, False
+        self.flights[key] = [job_id]
+        self.leaders[job_id] = key
+        return future, True
+
+    def is_streaming(self, job_id: int) -> bool:
+        return job_id in self.streams
+
+    def publish(self, job_id: int, progress: JobProgress) -> None:
+        # Only the leader's own RPC sees progress, coalesced RPCs joined late
+        stream = self.streams.get(job_id)
+        if stream is not None:
+            stream.put_nowait(progress)
+
+    def resolve(self, job_id: int, response: JobResponse) -> None:
+        key: bytes | None = self.leaders.pop(job_id, None)
+        waiting: list[int] = self.flights.pop(key, []) if key is not None else [job_id]
+        if not waiting:
+            # every RPC went away before the job finished
+            logger.debug(f"Dropping result for abandoned job {job_id}")
+        for waiting_job_id in waiting:
+            self.keys.pop(waiting_job_id, None)
+            future = self.pending.pop(waiting_job_id, None)
+            stream = self.streams.pop(waiting_job_id, None)
+            if future is None or future.done():
+                continue
+            waiting_response = JobResponse()
+            waiting_response.CopyFrom(response)
+            waiting_response.job_id = waiting_job_id
+            future.set_result(waiting_response)
+            if stream is not None:
+                stream.put_nowait(None)
+
+    def fail(self, job_id: int, error: Exception) -> None:
+        # Like resolve, every RPC waiting on the job gets the error instead
+        key: bytes | None = self.leaders.pop(job_id, None)
+        waiting: list[int] = self.flights.pop(key, []) if key is not None else [job_id]
+        for waiting_job_id in waiting:
+            self.keys.pop(waiting_job_id, None)
+            future = self.pending.pop(waiting_job_id, None)
+            stream = self.streams.pop(waiting_job_id, None)
+            if future is None or future.done():
+                continue
+            future.set_exception(error)
+            if stream is not None:
+                stream.put_nowait(None)
+
+    def discard(self, job_id: int) -> None:
+        future = self.pending.pop(job_id, None)
+        self.streams.pop(job_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+        key: bytes | None = self.keys.pop(job_id, None)
+        if key is None:
+            return
+        # The queued job keeps running for anyone else waiting on it or
+        # joining later. A leader's id stays taken until the job is done, the
+        # result comes back under it
+        self.flights[key].remove(job_id)
+
+
+def set_duration(response: JobResponse, request_timestamp: datetime) -> JobResponse:
+    duration: Duration = Duration()
+    duration.FromTimedelta(datetime.now(timezone.utc) - request_timestamp)
+    response.duration.CopyFrom(duration)
+    return response
+
+
 class JobManager(JobManagerServicer):
 
     def __init__(
         self,
         input_queue: Queue[tuple[int, JobRequest]],
-        output_queue: Queue[tuple[int, JobResponse]],
+        registry: JobRegistry,
+        lore_cache: LoreCache | None = None,
     ):
         self.input_queue: Queue[tuple[int, JobRequest]] = input_queue
-        self.output_queue: Queue[tuple[int, JobResponse]] = output_queue
+        self.registry: JobRegistry = registry
+        self.lore_cache: LoreCache | None = lore_cache
+
+    def cached(self, request: JobRequest) -> JobResponse | None:
+        # Lore generated before is answered right away, without waiting behind
+        # queued jobs or for the model to load
+        if self.lore_cache is None:
+            return None
+        if request.WhichOneof("job_payload") != "art_description_job":  # type: ignore
+            return None
+        art_job: JobRequest.ArtDescriptionJob = request.art_description_job
+        lore: tuple[str, str] | None = self.lore_cache.get(
+            self.lore_cache.key(art_job, request.language)
+        )
+        if lore is None:
+            return None
+        response: JobResponse = JobResponse(job_id=request.job_id)
+        response.art_description_response.CopyFrom(  # type: ignore
+            JobResponse.ArtDescriptionResponse(
+                hash_code=art_job.hash_code,
+                xml_def=art_job.xml_def,
+                title=lore[0],
+                description=lore[1],
+            )
+        )
+        return response
 
     async def JobService(self, request: JobRequest, context: RpcContext) -> JobResponse:
         request_timestamp: datetime = request.time.ToDatetime(tzinfo=timezone.utc)
         request_job_id: int = request.job_id
-        sleep_for: float = 0.5
         logger.debug("AIServer got job!")
 
         # Print request
         logger.debug(pformat(request))
 
-        # Put the request into the input queue
-        await self.input_queue.put((request_job_id, request))
+        cached: JobResponse | None = self.cached(request)
+        if cached is not None:
+            return set_duration(cached, request_timestamp)
 
-        # Wait for the job to be processed and get the result
-        while True:
-            response_job_id: int
-            response: JobResponse
+        # Register before queueing so the client can never finish first
+        try:
+            future: Future[JobResponse]
+            leader: bool
+            future, leader = self.registry.register(request)
+        except KeyError as e:
+            await context.abort(StatusCode.ALREADY_EXISTS, str(e))
+            raise
 
-            # Get the response from the output queue
-            response_job_id, response = await self.output_queue.get()
+        # Put the request into the input queue and wait for our own result
+        try:
+            if leader:
+                await self.input_queue.put((request_job_id, request))
+            response: JobResponse = await future
+        except BackendUnavailable as e:
+            await context.abort(StatusCode.UNAVAILABLE, str(e))
+            raise
+        finally:
+            self.registry.discard(request_job_id)
 
-            if response_job_id == request_job_id:
-                break
-            else:
-                # Put the job back into the output queue if it's not the result we're waiting for
-                await self.output_queue.put((response_job_id, response))
+        # Send the reply
+        return set_duration(response, request_timestamp)
+
+    async def JobServiceStream(
+        self, request: JobRequest, context: RpcContext
+    ) -> AsyncIterator[JobProgress]:
+        request_timestamp: datetime = request.time.ToDatetime(tzinfo=timezone.utc)
+        request_job_id: int = request.job_id
+        logger.debug("AIServer got streaming job!")
 
-            if context.cancelled():
-                raise CancelledError
+        # Print request
+        logger.debug(pformat(request))
 
-        # Finalize the job response
-        duration: Duration = Duration()
-        duration.FromTimedelta(datetime.now(timezone.utc) - request_timestamp)
-        response.duration.CopyFrom(duration)
+        cached: JobResponse | None = self.cached(request)
+        if cached is not None:
+            yield JobProgress(
+                job_id=request_job_id,
+                response=set_duration(cached, request_timestamp),
+            )
+            return
 
-        # Send the reply
-        return response
+        try:
+            future: Future[JobResponse]
+            leader: bool
+            future, leader = self.registry.register(request, stream=True)
+        except KeyError as e:
+            await context.abort(StatusCode.ALREADY_EXISTS, str(e))
+            raise
+        stream: Queue[JobProgress | None] = self.registry.streams[request_job_id]
+
+        # Relay progress until the client resolves the job
+        try:
+            if leader:
+                await self.input_queue.put((request_job_id, request))
+            while (progress := await stream.get()) is not None:
+                yield progress
+            response: JobResponse = await future
+        except BackendUnavailable as e:
+            await context.abort(StatusCode.UNAVAILABLE, str(e))
+            raise
+        finally:
+            self.registry.discard(request_job_id)
+
+        # The finished job is always the last message
+        yield JobProgress(
+            job_id=request_job_id,
+            response=set_duration(response, request_timestamp),
+        )
+
+    async def JobServiceBatch(
+        self, request: JobBatchRequest, context: RpcContext
+    ) -> AsyncIterator[JobResponse]:
+        logger.debug(f"AIServer got batch of {len(request.jobs)} jobs!")
+
+        # Only the ids we registered are ours to discard later
+        request_timestamps: dict[int, datetime] = {}
+        futures: dict[Future[JobResponse], int] = {}
+        leaders: list[JobRequest] = []
+        hits: list[tuple[JobResponse, datetime]] = []
+        try:
+            for job in request.jobs:
+                cached: JobResponse | None = self.cached(job)
+                if cached is not None:
+                    hits.append((cached, job.time.ToDatetime(tzinfo=timezone.utc)))
+                    continue
+                try:
+                    future, leader = self.registry.register(job)
+                except KeyError as e:
+                    await context.abort(StatusCode.ALREADY_EXISTS, str(e))
+                    raise
+                futures[future] = job.job_id
+                if leader:
+                    leaders.append(job)
+                request_timestamps[job.job_id] = job.time.ToDatetime(
+                    tzinfo=timezone.utc
+                )
+
+            # Queue the whole batch at once so every worker has something to do
+            for job in leaders:
+                await self.input_queue.put((job.job_id, job))
+
+            for cached, request_timestamp in hits:
+                yield set_duration(cached, request_timestamp)
+
+            # A failed job doesn't take the others' results with it
+            failed: dict[int, BaseException] = {}
+            running: set[Future[JobResponse]] = set(futures)
+            while running:
+                done, running = await wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    error: BaseException | None = future.exception()
+                    if error is not None:
+                        failed[futures[future]] = error
+                        continue
+                    yield set_duration(
+                        future.result(), request_timestamps[futures[future]]
+                    )
+
+            # the jobs missing from the stream are the ones named here
+            if failed:
+                unavailable: bool = all(
+                    isinstance(error, BackendUnavailable) for error in failed.values()
+                )
+                errors: str = "; ".join(
+                    f"{job_id}: {error}" for job_id, error in failed.items()
+                )
+                await context.abort(
+                    StatusCode.UNAVAILABLE if unavailable else StatusCode.UNKNOWN,
+                    f"{len(failed)} of {len(futures)} job(s) failed: {errors}",
+                )
+        finally:
+            for job_id in request_timestamps:
+                self.registry.discard(job_id)
 
 
 # async def health_test():
@@ -86,18 +349,21 @@ class JobManager(JobManagerServicer):
 
 async def run(
     input_queue: Queue[tuple[int, JobRequest]],
-    output_queue: Queue[tuple[int, JobResponse]],
+    registry: JobRegistry,
+    lore_cache: LoreCache | None = None,
 ):
     # health_check = ServiceCheck(health_test)
     # services_list = [
-    # JobManager(input_queue, output_queue),
+    # JobManager(input_queue, registry),
     # Health({OVERALL: [health_check]}),
     # Channelz(),
     # ]
     # services = ServerReflection.extend(services_list)
     global ai_server
     ai_server = server(ThreadPoolExecutor(max_workers=10))
-    add_JobManagerServicer_to_server(JobManager(input_queue, output_queue), ai_server)
+    add_JobManagerServicer_to_server(
+        JobManager(input_queue, registry, lore_cache), ai_server
+    )
     ai_server.add_insecure_port(f"{HOST}:{PORT}")
     try:
         await ai_server.start()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+from itertools import count
+from string import Template
+
+from . import metrics
+from .__init__ import logger
+
+# (template key, locale) of a prompt; prompts with the same prefix share the
+# static head that llama.cpp can reuse from a slot's KV cache
+PromptPrefix = tuple[str, str]
+
+
+def prompt_head(template: Template) -> str:
+    # everything before the first field is the same for every prompt
+    field = template.pattern.search(template.template)
+    return template.template[: field.start()] if field else template.template
+
+
+class SlotScheduler:
+    """Pins prompts to llamafile slots by the template prefix they start with."""
+
+    def __init__(self, slots: int):
+        self.in_flight: list[int] = [0] * slots
+        self.prefixes: list[PromptPrefix | None] = [None] * slots
+        self.sizes: list[int] = [0] * slots
+        self.last_used: list[int] = [0] * slots
+        self.requests: list[int] = [0] * slots
+        self.hits: list[int] = [0] * slots
+        self.clock = count(1)
+
+    def choose(self, prefix: PromptPrefix | None) -> int:
+        slots: range = range(len(self.in_flight))
+        idle: list[int] = [slot for slot in slots if self.in_flight[slot] == 0]
+        if idle:
+            # an idle slot already holding the prefix, else an empty one, else
+            # the one whose cached prompt is cheapest to evaluate again, so the
+            # long story prompts aren't pushed out by the short follow-ups
+            slot: int = min(
+                idle,
+                key=lambda s: (
+                    self.prefixes[s] != prefix,
+                    self.prefixes[s] is not None,
+                    self.sizes[s],
+                    self.last_used[s],
+                ),
+            )
+        else:
+            # every slot is busy, queue behind the least loaded one
+            slot = min(
+                slots, key=lambda s: (self.in_flight[s], self.prefixes[s] != prefix)
+            )
+        return slot
+
+    def acquire(self, prefix: PromptPrefix | None, size: int) -> int:
+        slot: int = self.choose(prefix)
+        hit: bool = prefix is not None and self.prefixes[slot] == prefix
+        self.requests[slot] += 1
+        if hit:
+            self.hits[slot] += 1
+        metrics.incr("slot_prefix_hits" if hit else "slot_prefix_misses")
+        self.in_flight[slot] += 1
+        self.prefixes[slot] = prefix
+        self.sizes[slot] = size
+        self.last_used[slot] = next(self.clock)
+        return slot
+
+    def release(self, slot: int) -> None:
+        self.in_flight[slot] -= 1
+
+    def assign(self, prefix: PromptPrefix, size: int) -> int | None:
+        # an empty slot for a prefix restored into it from outside, if any
+        slot: int = self.choose(prefix)
+        if self.prefixes[slot] is not None or self.in_flight[slot]:
+            return None
+        self.prefixes[slot] = prefix
+        self.sizes[slot] = size
+        self.last_used[slot] = next(self.clock)
+        return slot
+
+    def forget(self, slot: int) -> None:
+        self.prefixes[slot] = None
+        self.sizes[slot] = 0
+
+    def reset(self) -> None:
+        # a restarted llamafile comes back with every slot empty
+        for slot in range(len(self.prefixes)):
+            self.forget(slot)
+
+    def hit_rates(self) -> list[float]:
+        return [
+            hits / requests if requests else 0.0
+            for hits, requests in zip(self.hits, self.requests)
+        ]
+
+    def report(self, name: str) -> None:
+        if any(self.requests):
+            logger.info(
+                f"Slot prefix hit rates on {name}: "
+                + ", ".join(
+                    f"{slot}={rate:.0%} of {requests}"
+                    for slot, (rate, requests) in enumerate(
+                        zip(self.hit_rates(), self.requests)
+                    )
+                )
+            )
@@ -1,4 +1,5 @@
 import json
+import mmap
 import struct
 import zipfile
 import zlib
@@ -73,56 +74,93 @@ class TranslationManager:
         self.templates_native: dict[str, Template] = {}
         self.templates: dict[str, Template | None] = {}
         self.metadata: dict[str, dict[str, int]]
-        self.compressed_translations: dict[str, bytes]
         self.locale_data: dict[str, str]
-        self.metadata, self.compressed_translations = (
-            TranslationManager.read_compressed_translation_file(
-                self.pyz, self.translations_file
-            )
+        # decompressed locales and the finished template set for each
+        self.locale_cache: dict[str, dict[str, str]] = {}
+        self.template_sets: dict[str, MappingProxyType[str, Template]] = {}
+        # locales are only read from the container when first used
+        self.container: mmap.mmap | None
+        self.container_start: int
+        self.container, self.container_start = TranslationManager.map_translation_file(
+            self.pyz, self.translations_file
         )
+        self.metadata = self.read_translation_metadata()
 
     @staticmethod
-    def read_compressed_translation_file(
+    def map_translation_file(
         pyz: Path,
         translations_file: str,
-    ) -> tuple[dict[str, dict[str, int]], dict[str, bytes]]:
-        with zipfile.ZipFile(pyz, "r") as zip:
-            with zip.open(translations_file) as file:
-                # Read metadata size
-                metadata_size = struct.unpack(">I", file.read(4))[0]
-                logger.debug(f"Found metadata size: {metadata_size}")
-
-                # Read and decompress metadata
-                compressed_metadata = file.read(metadata_size)
-                decompressed_metadata = zlib.decompress(compressed_metadata)
-
-                # Read metadata
-                metadata: dict[str, dict[str, int]] = {}
-                entry_size = 58  # Each entry is 50 bytes for locale + 4 for offset + 4 for length
-                for i in range(0, len(decompressed_metadata), entry_size):
-                    locale_bytes, offset, length = struct.unpack(
-                        ">50sII", decompressed_metadata[i : i + entry_size]
+    ) -> tuple[mmap.mmap | None, int]:
+        """Maps the translations file read-only if it is a plain file or stored
+        uncompressed in the pyz, returning the mapping and where the file starts
+        in it. Returns no mapping if the pyz deflated it."""
+        if pyz.is_dir():
+            file_path = pyz / translations_file
+            offset = 0
+            length = file_path.stat().st_size
+        else:
+            with zipfile.ZipFile(pyz, "r") as zip:
+                info = zip.getinfo(translations_file)
+                if info.compress_type != zipfile.ZIP_STORED:
+                    logger.debug(
+                        "Translations are deflated in the pyz, reading by offset"
                     )
-                    locale_str = locale_bytes.decode("utf-8").strip("\x00")
-                    metadata[locale_str] = {"offset": offset, "length": length}
-                logger.debug(f"Found metadata: {metadata}")
-
-                # Read compressed locales
-                compressed_translations: dict[str, bytes] = {}
-                for locale, data in metadata.items():
-                    file.seek(data["offset"])
-                    compressed_data = file.read(data["length"])
-                    compressed_translations[locale] = compressed_data
-
-                return (metadata, compressed_translations)
+                    return None, 0
+                length = info.file_size
+            file_path = pyz
+            with file_path.open("rb") as file:
+                # data follows the 30 byte local header, file name and extra field
+                file.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", file.read(4))
+            offset = info.header_offset + 30 + name_length + extra_length
+
+        # mmap offsets must sit on an allocation boundary
+        map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        with file_path.open("rb") as file:
+            container = mmap.mmap(
+                file.fileno(),
+                length + offset - map_offset,
+                offset=map_offset,
+                access=mmap.ACCESS_READ,
+            )
+        return container, offset - map_offset
+
+    def read_translation_bytes(self, offset: int, length: int) -> bytes:
+        if self.container is not None:
+            start = self.container_start + offset
+            return self.container[start : start + length]
+        with zipfile.ZipFile(self.pyz, "r") as zip:
+            with zip.open(self.translations_file) as file:
+                file.seek(offset)
+                return file.read(length)
+
+    def read_translation_metadata(self) -> dict[str, dict[str, int]]:
+        # Read metadata size
+        metadata_size = struct.unpack(">I", self.read_translation_bytes(0, 4))[0]
+        logger.debug(f"Found metadata size: {metadata_size}")
+
+        # Read and decompress metadata
+        compressed_metadata = self.read_translation_bytes(4, metadata_size)
+        decompressed_metadata = zlib.decompress(compressed_metadata)
+
+        # Read metadata
+        metadata: dict[str, dict[str, int]] = {}
+        # Each entry is 50 bytes for locale + 4 for offset + 4 for length
+        entry_size = 58
+        for i in range(0, len(decompressed_metadata), entry_size):
+            locale_bytes, offset, length = struct.unpack(
+                ">50sII", decompressed_metadata[i : i + entry_size]
+            )
+            locale_str = locale_bytes.decode("utf-8").strip("\x00")
+            metadata[locale_str] = {"offset": offset, "length": length}
+        logger.debug(f"Found metadata: {metadata}")
+        return metadata
 
     @staticmethod
-    def decompress_locale(
-        locale: str, compressed_translations: dict[str, bytes]
-    ) -> dict[str, str]:
+    def decompress_locale(locale: str, compressed_data: bytes) -> dict[str, str]:
         try:
             # Decompress the data
-            decompressed_data = zlib.decompress(compressed_translations[locale])
+            decompressed_data = zlib.decompress(compressed_data)
             # Parse the decompressed JSON string back into a dictionary
             translations_dict = json.loads(decompressed_data.decode("utf-8"))
             return translations_dict
@@ -139,6 +177,48 @@ class TranslationManager:
             raise ValueError("Could not find translation for template!")
         return template
 
+    def get_locale_data(self, locale_id: str) -> dict[str, str]:
+        locale_data = self.locale_cache.get(locale_id)
+        if locale_data is None:
+            locale_info = self.metadata.get(locale_id)
+            if locale_info is not None:
+                locale_data = TranslationManager.decompress_locale(
+                    locale_id,
+                    self.read_translation_bytes(
+                        locale_info["offset"], locale_info["length"]
+                    ),
+                )
+            else:
+                logger.warning(f"No translations for {locale_id}, using native")
+                locale_data = {}
+            self.locale_cache[locale_id] = locale_data
+        return locale_data
+
+    def get_templates(
+        self, locale: SupportedLanguage
+    ) -> MappingProxyType[str, Template]:
+        """Read-only templates for one locale, safe to hold across awaits."""
+        locale_id = LanguageFormat.language_map.get(locale)
+        if locale_id is None:
+            raise ValueError("Could not find locale in database!")
+        templates = self.template_sets.get(locale_id)
+        if templates is not None:
+            return templates
+
+        locale_templates: dict[str, Template] = {}
+        locale_data = (
+            {} if locale_id == self.native_locale else self.get_locale_data(locale_id)
+        )
+        for name, template_str in self.templates_native.items():
+            value = locale_data.get(template_str.template)
+            if value is None and locale_data:
+                logger.warning(f"Could not find key in locale data:\n{template_str}")
+            # untranslated entries fall back to the native template
+            locale_templates[name] = Template(value or template_str.template)
+        templates = MappingProxyType(locale_templates)
+        self.template_sets[locale_id] = templates
+        return templates
+
     def set_locale(self, locale: SupportedLanguage):
         locale_id = LanguageFormat.language_map.get(locale)
         if locale_id is None:
@@ -146,19 +226,14 @@ class TranslationManager:
         if self.current_locale == locale_id:
             return
         self.current_locale = locale_id
-        self.locale_data = TranslationManager.decompress_locale(
-            locale_id, self.compressed_translations
-        )
-        for name, template_str in self.templates_native.items():
-            value = self.locale_data.get(template_str.template)
-            if value is None:
-                raise ValueError(f"Could not find key in locale data:\n{template_str}")
-            self.templates[name] = Template(value)
+        self.templates = dict(self.get_templates(locale))
 
     def register_template(self, name: str, template_str: str):
         self.templates[name] = Template(template_str)
         if self.current_locale == self.native_locale:
             self.templates_native[name] = Template(template_str)
+        # template sets built so far are missing this one
+        self.template_sets.clear()
 
 
 trans_manager = TranslationManager(
@@ -254,7 +329,7 @@ This universe is a tapestry of interconnected worlds, each with unique societies
 
 ### Narrative Style and Tone
 
-The narrative can range from serious and epic to humorous and ironic, depending on the context. Use $len sentences surrounded in quotes.
+The narrative can range from serious and epic to humorous and ironic, depending on the context.
 
 ### Example Input and Output
 
@@ -275,6 +350,8 @@ On this work is an artwork of a hand reaching upwards. The fingers are forever s
 $title
 
 $description
+
+Use $len sentences surrounded in quotes.
 """.strip()
     ),
 )
@@ -338,7 +415,7 @@ This universe is a tapestry of interconnected worlds, each with unique societal
 
 ### Narrative Style and Tone
 
-The narrative should be vivid, engaging, and consistent with the described setting. It can range from serious and epic to humorous and ironic, depending on the context. Use descriptive language to ensure the lore is coherent and immersive. Use $len sentences surrounded in quotes.
+The narrative should be vivid, engaging, and consistent with the described setting. It can range from serious and epic to humorous and ironic, depending on the context. Use descriptive language to ensure the lore is coherent and immersive.
 
 ### Example Input and Output
 
@@ -371,6 +448,8 @@ On this work is an artwork of a dragon intertwined with a tree. The dragon's eye
 $title
 
 $description
+
+Use $len sentences surrounded in quotes.
 """.strip()
     ),
 )
@@ -469,7 +548,7 @@ This universe is a tapestry of interconnected worlds, each with unique societal
 
 ### Narrative Style and Tone
 
-The narrative should be vivid, engaging, and consistent with the described setting. It can range from serious and epic to humorous and ironic, depending on the context. However, the setting in the input takes precedence. Use descriptive language to bring what you're given to life, and ensure the lore is coherent and immersive. Use $len sentences surrounded in quotes.
+The narrative should be vivid, engaging, and consistent with the described setting. It can range from serious and epic to humorous and ironic, depending on the context. However, the setting in the input takes precedence. Use descriptive language to bring what you're given to life, and ensure the lore is coherent and immersive.
 
 ### Example Input and Output
 
@@ -514,6 +593,8 @@ On this work is an artwork of a figure attempting to hold a fragile structure. T
 $title
 
 $description
+
+Use $len sentences surrounded in quotes.
 """.strip()
     ),
 )
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from types import MappingProxyType
+
+# generated by protoc
+from .job.job_pb2 import SupportedLanguage
+
+# Sentence-final punctuation a finished story may end with. Models writing
+# CJK or Arabic still fall back to ASCII punctuation often enough to allow it
+LATIN_TERMINATORS: frozenset[str] = frozenset(".!?…")
+ARABIC_TERMINATORS: frozenset[str] = LATIN_TERMINATORS | frozenset("؟۔")
+CJK_TERMINATORS: frozenset[str] = LATIN_TERMINATORS | frozenset("。．！？")
+
+TERMINAL_PUNCTUATION: MappingProxyType[int, frozenset[str]] = MappingProxyType(
+    {
+        SupportedLanguage.ARABIC: ARABIC_TERMINATORS,
+        SupportedLanguage.CHINESE_SIMPLIFIED: CJK_TERMINATORS,
+        SupportedLanguage.CHINESE_TRADITIONAL: CJK_TERMINATORS,
+        SupportedLanguage.CZECH: LATIN_TERMINATORS,
+        SupportedLanguage.DANISH: LATIN_TERMINATORS,
+        SupportedLanguage.DUTCH: LATIN_TERMINATORS,
+        SupportedLanguage.ENGLISH: LATIN_TERMINATORS,
+        SupportedLanguage.ESTONIAN: LATIN_TERMINATORS,
+        SupportedLanguage.FINNISH: LATIN_TERMINATORS,
+        SupportedLanguage.FRENCH: LATIN_TERMINATORS,
+        SupportedLanguage.GERMAN: LATIN_TERMINATORS,
+        SupportedLanguage.HUNGARIAN: LATIN_TERMINATORS,
+        SupportedLanguage.ITALIAN: LATIN_TERMINATORS,
+        SupportedLanguage.JAPANESE: CJK_TERMINATORS,
+        SupportedLanguage.KOREAN: CJK_TERMINATORS,
+        SupportedLanguage.NORWEGIAN: LATIN_TERMINATORS,
+        SupportedLanguage.POLISH: LATIN_TERMINATORS,
+        SupportedLanguage.PORTUGUESE: LATIN_TERMINATORS,
+        SupportedLanguage.PORTUGUESE_BRAZILIAN: LATIN_TERMINATORS,
+        SupportedLanguage.ROMANIAN: LATIN_TERMINATORS,
+        SupportedLanguage.RUSSIAN: LATIN_TERMINATORS,
+        SupportedLanguage.SLOVAK: LATIN_TERMINATORS,
+        SupportedLanguage.SPANISH: LATIN_TERMINATORS,
+        SupportedLanguage.SPANISH_LATIN: LATIN_TERMINATORS,
+        SupportedLanguage.SWEDISH: LATIN_TERMINATORS,
+        SupportedLanguage.TURKISH: LATIN_TERMINATORS,
+        SupportedLanguage.UKRAINIAN: LATIN_TERMINATORS,
+    }
+)
+
+# Closing quotes and brackets that may follow the last sentence's punctuation,
+# e.g. ...said 'run.' or ...«fin.» (double quotes can't occur, the grammar
+# forbids them inside the story)
+CLOSING_MARKS: str = "'’‘»«”“)]}」』）"
+
+
+def ends_sentence(story: str, language: SupportedLanguage) -> bool:
+    text: str = story.rstrip().rstrip(CLOSING_MARKS).rstrip()
+    if not text:
+        return False
+    return text[-1] in TERMINAL_PUNCTUATION.get(language, LATIN_TERMINATORS)
+
+
+def story_cut_off(
+    story: str, language: SupportedLanguage, finish_reason: str | None
+) -> bool | None:
+    """Whether a story was cut off, or None if that can't be told locally."""
+    # llama.cpp reports "length" when it ran out of tokens mid-story
+    if finish_reason == "length":
+        return True
+    if not ends_sentence(story, language):
+        return True
+    # the quote grammar only lets the model stop after the closing quote
+    if finish_reason == "stop":
+        return False
+    return None
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from asyncio import Future, Queue
+
+
+# Mirrors the pre-registry JobManager.JobService: every waiting RPC pulls from
+# the shared output queue and puts back whatever isn't its own job
+async def rpc_requeue(
+    job_id: int,
+    input_queue: Queue[int],
+    output_queue: Queue[tuple[int, float]],
+) -> float:
+    await input_queue.put(job_id)
+    while True:
+        response_job_id, finished_at = await output_queue.get()
+        if response_job_id == job_id:
+            return time.perf_counter() - finished_at
+        await output_queue.put((response_job_id, finished_at))
+        # Queue.get/put never suspend on a non-empty unbounded queue, so the
+        # original loop starves the event loop as soon as it holds a foreign
+        # job; yield here so the old strategy can be measured at all
+        await asyncio.sleep(0)
+
+
+async def worker_requeue(
+    input_queue: Queue[int],
+    output_queue: Queue[tuple[int, float]],
+    service_time: float,
+) -> None:
+    while True:
+        job_id = await input_queue.get()
+        await asyncio.sleep(random.uniform(0, service_time))
+        await output_queue.put((job_id, time.perf_counter()))
+
+
+# Mirrors server.JobRegistry: each RPC awaits its own future
+async def rpc_registry(
+    job_id: int,
+    input_queue: Queue[int],
+    pending: dict[int, Future[float]],
+) -> float:
+    future: Future[float] = asyncio.get_running_loop().create_future()
+    pending[job_id] = future
+    await input_queue.put(job_id)
+    finished_at = await future
+    return time.perf_counter() - finished_at
+
+
+async def worker_registry(
+    input_queue: Queue[int],
+    pending: dict[int, Future[float]],
+    service_time: float,
+) -> None:
+    while True:
+        job_id = await input_queue.get()
+        await asyncio.sleep(random.uniform(0, service_time))
+        pending.pop(job_id).set_result(time.perf_counter())
+
+
+async def run_once(
+    mode: str, in_flight: int, workers: int, service_time: float, timeout: float
+) -> list[float] | None:
+    input_queue: Queue[int] = Queue()
+    if mode == "requeue":
+        output_queue: Queue[tuple[int, float]] = Queue()
+        worker_tasks = [
+            asyncio.create_task(worker_requeue(input_queue, output_queue, service_time))
+            for _ in range(workers)
+        ]
+        rpcs = [rpc_requeue(i, input_queue, output_queue) for i in range(in_flight)]
+    else:
+        pending: dict[int, Future[float]] = {}
+        worker_tasks = [
+            asyncio.create_task(worker_registry(input_queue, pending, service_time))
+            for _ in range(workers)
+        ]
+        rpcs = [rpc_registry(i, input_queue, pending) for i in range(in_flight)]
+    try:
+        latencies = await asyncio.wait_for(asyncio.gather(*rpcs), timeout)
+    except asyncio.TimeoutError:
+        # RPCs kept stealing each other's results and never converged
+        latencies = None
+    for task in worker_tasks:
+        task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    return latencies
+
+
+# Mirrors the pre-blocking AIClient.start intake: poll and nap when idle
+async def intake_polling(input_queue: Queue[float], waits: list[float]) -> None:
+    while True:
+        try:
+            queued_at = input_queue.get_nowait()
+            waits.append(time.perf_counter() - queued_at)
+        except asyncio.QueueEmpty:
+            await asyncio.sleep(0.5)
+
+
+async def intake_blocking(input_queue: Queue[float], waits: list[float]) -> None:
+    while True:
+        queued_at = await input_queue.get()
+        waits.append(time.perf_counter() - queued_at)
+
+
+async def run_intake(mode: str, jobs: int, max_gap: float) -> list[float]:
+    input_queue: Queue[float] = Queue()
+    waits: list[float] = []
+    intake = intake_polling if mode == "polling" else intake_blocking
+    worker = asyncio.create_task(intake(input_queue, waits))
+    for _ in range(jobs):
+        # jobs trickle in while the worker is idle, like art spawning in-game
+        await asyncio.sleep(random.uniform(0, max_gap))
+        await input_queue.put(time.perf_counter())
+    while len(waits) < jobs:
+        await asyncio.sleep(0.01)
+    worker.cancel()
+    await asyncio.gather(worker, return_exceptions=True)
+    return waits
+
+
+def p99(samples: list[float]) -> float:
+    return statistics.quantiles(samples, n=100)[98] if len(samples) > 1 else samples[0]
+
+
+def bench_registry(args: argparse.Namespace) -> None:
+    print(
+        f"{'in-flight':>9} {'mode':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'stalled':>8}"
+    )
+    for in_flight in (1, 10, 100):
+        for mode in ("requeue", "registry"):
+            samples: list[float] = []
+            stalled: int = 0
+            for _ in range(args.rounds):
+                latencies = asyncio.run(
+                    run_once(
+                        mode, in_flight, args.workers, args.service_time, args.timeout
+                    )
+                )
+                if latencies is None:
+                    stalled += 1
+                else:
+                    samples += latencies
+            if samples:
+                p50_ms = f"{statistics.median(samples) * 1000:>10.3f}"
+                p99_ms = f"{p99(samples) * 1000:>10.3f}"
+            else:
+                p50_ms = p99_ms = f"{'-':>10}"
+            print(
+                f"{in_flight:>9} {mode:>8} {p50_ms} {p99_ms} {stalled:>5}/{args.rounds}"
+            )
+
+
+def bench_intake(args: argparse.Namespace) -> None:
+    buckets_ms: list[float] = [0.1, 1, 10, 100, 500]
+    labels: list[str] = [f"<{b:g}ms" for b in buckets_ms] + [f">={buckets_ms[-1]:g}ms"]
+    print(f"{'mode':>8} " + " ".join(f"{label:>8}" for label in labels) + "  max (ms)")
+    for mode in ("polling", "blocking"):
+        waits = asyncio.run(run_intake(mode, args.jobs, args.max_gap))
+        counts: list[int] = [0] * len(labels)
+        for wait in waits:
+            counts[
+                next(
+                    (i for i, b in enumerate(buckets_ms) if wait * 1000 < b),
+                    len(buckets_ms),
+                )
+            ] += 1
+        print(
+            f"{mode:>8} "
+            + " ".join(f"{count:>8}" for count in counts)
+            + f"  {max(waits) * 1000:>8.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Job dispatch micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    registry_parser = subparsers.add_parser(
+        "registry",
+        help="Completion-to-RPC dispatch latency, shared queue vs per-job futures",
+    )
+    registry_parser.add_argument("--rounds", type=int, default=20)
+    registry_parser.add_argument("--workers", type=int, default=4)
+    registry_parser.add_argument("--service-time", type=float, default=0.005)
+    registry_parser.add_argument("--timeout", type=float, default=5.0)
+    registry_parser.set_defaults(func=bench_registry)
+
+    intake_parser = subparsers.add_parser(
+        "intake",
+        help="Histogram of queue wait before a worker picks up a job",
+    )
+    intake_parser.add_argument("--jobs", type=int, default=50)
+    intake_parser.add_argument("--max-gap", type=float, default=0.2)
+    intake_parser.set_defaults(func=bench_intake)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import time
+from pathlib import Path
+from string import Template
+
+import httpx
+import polib
+
+LOCALES_DIR = Path(__file__).parent.parent / "locales"
+SCHEMAS_DIR = Path(__file__).parent.parent / "src" / "AIServer" / "schemas"
+STOP: list[str] = ["<|end|>", "<|endoftext|>", "<|im_end|>", "\n", "\r"]
+
+SAMPLE_ARTS: list[tuple[str, str]] = [
+    (
+        "Jade sculpture",
+        "A sculpture of a sleeping fox curled around a broken spear.",
+    ),
+    (
+        "Granite grand sculpture",
+        "A towering figure of a colonist holding a lantern over a frozen lake.",
+    ),
+    (
+        "Steel small sculpture",
+        "Two muffalo locked horns beneath a crescent moon.",
+    ),
+    (
+        "Wood relief",
+        "A carving of a raider fleeing from a swarm of angry squirrels.",
+    ),
+    (
+        "Marble sculpture",
+        "A doctor kneels beside a patient as a storm breaks overhead.",
+    ),
+]
+
+
+def locale_templates(locale: str) -> dict[str, str]:
+    po = polib.pofile(str(LOCALES_DIR / locale / "LC_MESSAGES" / "messages.po"))
+    # the msgids are the English templates, recognise them by placeholder
+    by_placeholder: dict[str, str] = {
+        "$defin": "short_t",
+        "$info": "length_t",
+        "$pas": "name_t",
+    }
+    templates: dict[str, str] = {}
+    stories: list[str] = []
+    for entry in po:
+        text = entry.msgstr or entry.msgid
+        if "$title" in entry.msgid and "$len" in entry.msgid:
+            stories.append(text)
+        for placeholder, key in by_placeholder.items():
+            if placeholder in entry.msgid:
+                templates[key] = text
+    # mini, small and medium story prompts, shortest first
+    for key, story in zip(
+        ("story_mini_t", "story_small_t", "story_medium_t"), sorted(stories, key=len)
+    ):
+        templates[key] = story
+    return templates
+
+
+def story_templates(locale: str) -> list[str]:
+    templates = locale_templates(locale)
+    return [templates[f"story_{size}_t"] for size in ("mini", "small", "medium")]
+
+
+def chat(
+    client: httpx.Client,
+    content: str,
+    cache_prompt: bool = True,
+    max_tokens: int | None = None,
+    grammar: str | None = None,
+) -> dict:
+    body: dict = {
+        "messages": [{"role": "user", "content": content.strip()}],
+        "temperature": 0.7,
+        "cache_prompt": cache_prompt,
+        "stop": STOP,
+    }
+    if max_tokens is not None:
+        body["max_tokens"] = max_tokens
+    if grammar is not None:
+        body["grammar"] = grammar
+    r = client.post("/v1/chat/completions", json=body)
+    r.raise_for_status()
+    return r.json()
+
+
+def reply_of(response: dict) -> str:
+    return (response["choices"][0]["message"].get("content") or "").strip()
+
+
+def quoted(s: str) -> str | None:
+    match = re.match(r"^[ \t]*\"([^\"]+)\"[ \t]*$", s)
+    return match.group(1) if match else None
+
+
+def bench_prompt_cache(args: argparse.Namespace) -> None:
+    template: Template = Template(story_templates(args.locale)[args.template])
+    print(
+        f"{'cache_prompt':>12} {'prompt_n':>9} {'prompt_ms p50':>14} {'prompt_ms mean':>15}"
+    )
+    with httpx.Client(base_url=args.url, timeout=args.timeout) as client:
+        for cache_prompt in (False, True):
+            prompt_n: list[float] = []
+            prompt_ms: list[float] = []
+            for _ in range(args.jobs):
+                # a different art piece each time, only the tail of the prompt changes
+                title, description = random.choice(SAMPLE_ARTS)
+                content = template.safe_substitute(
+                    len=random.randint(2, 9), title=title, description=description
+                )
+                timings = chat(client, content, cache_prompt, args.max_tokens).get(
+                    "timings", {}
+                )
+                prompt_n.append(timings.get("prompt_n", 0))
+                prompt_ms.append(timings.get("prompt_ms", 0))
+            # the first request of each run always pays for the full prompt
+            print(
+                f"{str(cache_prompt):>12} {statistics.mean(prompt_n[1:]):>9.1f}"
+                f" {statistics.median(prompt_ms[1:]):>14.1f}"
+                f" {statistics.mean(prompt_ms[1:]):>15.1f}"
+            )
+
+
+# Mirrors AIClient.do_art_description_multi: story, validation and naming in
+# separate calls, each retried up to 5 times
+def job_multi(
+    client: httpx.Client,
+    templates: dict[str, Template],
+    grammars: dict[str, str],
+    story_msg: str,
+    story_text: str,
+) -> int:
+    calls: int = 0
+    story: str | None = None
+    for _ in range(6):
+        reply = reply_of(chat(client, story_msg, grammar=grammars["quote"]))
+        calls += 1
+        story = quoted(reply)
+        if story is None:
+            continue
+        verdict = reply_of(
+            chat(
+                client,
+                "Is the below content cut off at the end? Please answer Yes or No."
+                f"\n\n{story}",
+                grammar=grammars["yesno"],
+            )
+        )
+        calls += 1
+        if verdict != "Yes":
+            break
+    name_msg = templates["name_t"].safe_substitute(pas=story or story_text)
+    for _ in range(6):
+        calls += 1
+        if quoted(reply_of(chat(client, name_msg, grammar=grammars["quote"]))):
+            break
+    return calls
+
+
+# Mirrors AIClient.do_art_description_structured, multi-call when it won't parse
+def job_single(
+    client: httpx.Client,
+    templates: dict[str, Template],
+    grammars: dict[str, str],
+    story_msg: str,
+    story_text: str,
+) -> int:
+    reply = reply_of(chat(client, story_msg, grammar=grammars["lore"]))
+    try:
+        lore = json.loads(reply)
+        if lore.get("story", "").strip() and lore.get("title", "").strip():
+            return 1
+    except (json.JSONDecodeError, AttributeError):
+        pass
+    return 1 + job_multi(client, templates, grammars, story_msg, story_text)
+
+
+def bench_pipeline(args: argparse.Namespace) -> None:
+    templates: dict[str, Template] = {
+        key: Template(text) for key, text in locale_templates(args.locale).items()
+    }
+    grammars: dict[str, str] = {
+        name: (SCHEMAS_DIR / f"{name}.gbnf").read_text()
+        for name in ("quote", "yesno", "lore")
+    }
+    story_template: Template = templates[
+        ("story_mini_t", "story_small_t", "story_medium_t")[args.template]
+    ]
+    print(
+        f"{'mode':>8} {'calls/job':>10} {'p50 (s)':>9} {'p99 (s)':>9} {'mean (s)':>9}"
+    )
+    with httpx.Client(base_url=args.url, timeout=args.timeout) as client:
+        for mode, job in (("multi", job_multi), ("single", job_single)):
+            calls: list[int] = []
+            latencies: list[float] = []
+            for _ in range(args.jobs):
+                title, description = random.choice(SAMPLE_ARTS)
+                short_desc = templates["short_t"].safe_substitute(
+                    defin="SculptureSmall", stuff="Jade", quality="Good"
+                )
+                story_msg = story_template.safe_substitute(
+                    len=random.randint(2, 9),
+                    title=title,
+                    description=short_desc + "\n\n" + description,
+                )
+                started = time.perf_counter()
+                calls.append(job(client, templates, grammars, story_msg, description))
+                latencies.append(time.perf_counter() - started)
+            p99 = (
+                statistics.quantiles(latencies, n=100)[98]
+                if len(latencies) > 1
+                else latencies[0]
+            )
+            print(
+                f"{mode:>8} {statistics.mean(calls):>10.2f}"
+                f" {statistics.median(latencies):>9.2f} {p99:>9.2f}"
+                f" {statistics.mean(latencies):>9.2f}"
+            )
+
+
+# The old AIClient made a new Client (and so a new connection pool) per health
+# check; compare that with one long-lived pool over the same requests
+async def request_latencies(url: str, requests: int, pooled: bool) -> list[float]:
+    latencies: list[float] = []
+    shared: httpx.AsyncClient | None = (
+        httpx.AsyncClient(base_url=url) if pooled else None
+    )
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            if shared is not None:
+                r = await shared.get("/health")
+            else:
+                async with httpx.AsyncClient(base_url=url) as fresh:
+                    r = await fresh.get("/health")
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+    finally:
+        if shared is not None:
+            await shared.aclose()
+    return latencies
+
+
+def bench_connections(args: argparse.Namespace) -> None:
+    print(f"{'client':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'mean (ms)':>10}")
+    for name, pooled in (("fresh", False), ("pooled", True)):
+        latencies = asyncio.run(request_latencies(args.url, args.requests, pooled))
+        # drop the first request, it pays for the connection either way
+        latencies = latencies[1:]
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(
+            f"{name:>8} {statistics.median(latencies) * 1000:>10.3f}"
+            f" {p99 * 1000:>10.3f} {statistics.mean(latencies) * 1000:>10.3f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks against a running llamafile server"
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:50052")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    prompt_cache_parser = subparsers.add_parser(
+        "prompt-cache",
+        help="Prompt evaluation time of story prompts with and without cache_prompt",
+    )
+    prompt_cache_parser.add_argument("--locale", default="en")
+    prompt_cache_parser.add_argument(
+        "--template", type=int, default=0, help="0 mini, 1 small, 2 medium"
+    )
+    prompt_cache_parser.add_argument("--jobs", type=int, default=10)
+    prompt_cache_parser.add_argument("--max-tokens", type=int, default=8)
+    prompt_cache_parser.set_defaults(func=bench_prompt_cache)
+
+    pipeline_parser = subparsers.add_parser(
+        "pipeline",
+        help="Calls per art job and job latency, multi-call vs single structured call",
+    )
+    pipeline_parser.add_argument("--locale", default="en")
+    pipeline_parser.add_argument(
+        "--template", type=int, default=0, help="0 mini, 1 small, 2 medium"
+    )
+    pipeline_parser.add_argument("--jobs", type=int, default=10)
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    connections_parser = subparsers.add_parser(
+        "connections",
+        help="Per-request latency with a new client each time vs one pooled client",
+    )
+    connections_parser.add_argument("--requests", type=int, default=200)
+    connections_parser.set_defaults(func=bench_connections)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
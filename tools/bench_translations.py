@@ -0,0 +1,130 @@
+import argparse
+import json
+import mmap
+import struct
+import subprocess
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+TRANSLATIONS_FILE = "AIServer/translations.json.zlib"
+
+
+def rss_kib() -> int:
+    # current, not peak, resident set size; Linux only
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * mmap.PAGESIZE // 1024
+
+
+def read_metadata(file) -> dict[str, dict[str, int]]:
+    metadata_size = struct.unpack(">I", file.read(4))[0]
+    decompressed_metadata = zlib.decompress(file.read(metadata_size))
+    metadata: dict[str, dict[str, int]] = {}
+    for i in range(0, len(decompressed_metadata), 58):
+        locale_bytes, offset, length = struct.unpack(
+            ">50sII", decompressed_metadata[i : i + 58]
+        )
+        metadata[locale_bytes.decode("utf-8").strip("\x00")] = {
+            "offset": offset,
+            "length": length,
+        }
+    return metadata
+
+
+# Mirrors the old TranslationManager: every locale's bytes are read at import
+def load_eager(pyz: Path, locales: list[str]) -> None:
+    with zipfile.ZipFile(pyz, "r") as zip:
+        with zip.open(TRANSLATIONS_FILE) as file:
+            metadata = read_metadata(file)
+            compressed_translations: dict[str, bytes] = {}
+            for locale, data in metadata.items():
+                file.seek(data["offset"])
+                compressed_translations[locale] = file.read(data["length"])
+    for locale in locales:
+        json.loads(zlib.decompress(compressed_translations[locale]))
+    globals()["keep"] = compressed_translations
+
+
+# Mirrors the lazy TranslationManager on a pyz with the file stored uncompressed
+def load_lazy(pyz: Path, locales: list[str]) -> None:
+    with zipfile.ZipFile(pyz, "r") as zip:
+        info = zip.getinfo(TRANSLATIONS_FILE)
+    if info.compress_type != zipfile.ZIP_STORED:
+        sys.exit(f"{TRANSLATIONS_FILE} must be stored uncompressed (zip -0)")
+    with pyz.open("rb") as file:
+        file.seek(info.header_offset + 26)
+        name_length, extra_length = struct.unpack("<HH", file.read(4))
+        offset = info.header_offset + 30 + name_length + extra_length
+        map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+        container = mmap.mmap(
+            file.fileno(),
+            info.file_size + offset - map_offset,
+            offset=map_offset,
+            access=mmap.ACCESS_READ,
+        )
+    start = offset - map_offset
+    metadata_size = struct.unpack(">I", container[start : start + 4])[0]
+    metadata: dict[str, dict[str, int]] = {}
+    decompressed_metadata = zlib.decompress(
+        container[start + 4 : start + 4 + metadata_size]
+    )
+    for i in range(0, len(decompressed_metadata), 58):
+        locale_bytes, locale_offset, length = struct.unpack(
+            ">50sII", decompressed_metadata[i : i + 58]
+        )
+        metadata[locale_bytes.decode("utf-8").strip("\x00")] = {
+            "offset": locale_offset,
+            "length": length,
+        }
+    for locale in locales:
+        data = metadata[locale]
+        locale_start = start + data["offset"]
+        json.loads(
+            zlib.decompress(container[locale_start : locale_start + data["length"]])
+        )
+    globals()["keep"] = container
+
+
+def measure(mode: str, pyz: Path, locales: list[str]) -> None:
+    before = rss_kib()
+    start = time.perf_counter()
+    (load_eager if mode == "eager" else load_lazy)(pyz, locales)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"ms": elapsed * 1000, "rss_kib": rss_kib() - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Translation loading time and RSS, eager vs lazy mmap"
+    )
+    parser.add_argument("pyz", type=Path, help="AIServer.pyz built per README")
+    parser.add_argument("--locales", nargs="*", default=["en"])
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--measure", choices=["eager", "lazy"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.pyz, args.locales)
+        return
+
+    print(f"{'mode':>6} {'load (ms)':>10} {'RSS (KiB)':>10}  locales={args.locales}")
+    for mode in ("eager", "lazy"):
+        # fresh interpreter per round so RSS isn't shared between modes
+        results = [
+            json.loads(
+                subprocess.check_output(
+                    [sys.executable, __file__, str(args.pyz), "--measure", mode]
+                    + ["--locales", *args.locales]
+                )
+            )
+            for _ in range(args.rounds)
+        ]
+        ms = sorted(result["ms"] for result in results)[len(results) // 2]
+        rss = sorted(result["rss_kib"] for result in results)[len(results) // 2]
+        print(f"{mode:>6} {ms:>10.2f} {rss:>10}")
+
+
+if __name__ == "__main__":
+    main()